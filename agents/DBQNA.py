@@ -1,15 +1,74 @@
 import os 
+from functools import lru_cache
 from langchain_core.tools import tool
-import sqlite3
-from langchain.chat_models import init_chat_model
-
-model = init_chat_model("gpt-4.1-mini", model_provider= "openai")
-DB_PATH = os.environ['DB_PATH']
+from agents.llm import get_chat_model
+from agents.sqlite_pool import get_pool
+from agents import schema_catalog
+from agents.sql_guard import extract_sql, validate_query
+from agents import query_cache
+
+DB_PATH = os.environ.get('DB_PATH')
+QUERY_MAX_ROWS = int(os.environ.get('QUERY_MAX_ROWS', '50'))
+QUERY_MAX_BYTES = int(os.environ.get('QUERY_MAX_BYTES', '16000'))
+QUERY_COUNT_LIMIT = int(os.environ.get('QUERY_COUNT_LIMIT', '100000'))
+FETCH_BATCH_SIZE = 256
+
+# the chat model is created on first use, not at import
+@lru_cache(maxsize=None)
+def get_model():
+    return get_chat_model("gpt-4.1-mini")
 
 # Supporting function 
-def create_cursor(path_to_db:str):
-    connection = sqlite3.connect(path_to_db)
-    return connection.cursor()
+def format_query_result(cursor, max_rows: int = QUERY_MAX_ROWS, max_bytes: int = QUERY_MAX_BYTES, count_limit: int = QUERY_COUNT_LIMIT):
+    """
+        Renders an executed cursor in fetchmany batches, keeping at most max_rows rows and max_bytes bytes.
+        Rows past the limits are only counted (up to count_limit), never kept in memory, and the cursor is closed.
+
+        Return:
+        (output string, metadata dict with rows_shown, total_rows, total_is_exact and truncated)
+    """
+    lines = []
+    used_bytes = 0
+    rows_shown = 0
+    total_rows = 0
+    truncated = False
+
+    try:
+        field_names = " | ".join([column[0] for column in cursor.description or []])
+        # one row past count_limit is enough to tell an exact count from a capped one
+        while total_rows <= count_limit:
+            batch = cursor.fetchmany(min(FETCH_BATCH_SIZE, count_limit + 1 - total_rows))
+            if not batch:
+                break
+            total_rows += len(batch)
+            if truncated:
+                # past the limits: keep counting so we can tell the model how much was left out
+                continue
+            for record in batch:
+                line = " | ".join([str(cell) for cell in record])
+                line_bytes = len(line.encode("utf-8")) + 1
+                if rows_shown >= max_rows or used_bytes + line_bytes > max_bytes:
+                    truncated = True
+                    break
+                lines.append(line)
+                used_bytes += line_bytes
+                rows_shown += 1
+    finally:
+        # drop the rows past count_limit instead of leaving the statement open on a pooled connection
+        cursor.close()
+
+    total_is_exact = total_rows <= count_limit
+    total_rows = min(total_rows, count_limit)
+    metadata = {"rows_shown": rows_shown, "total_rows": total_rows, "total_is_exact": total_is_exact, "truncated": truncated}
+
+    if total_rows == 0:
+        return "No data is returned.\n\n", metadata
+
+    output = [field_names] + lines
+    if truncated:
+        total = f"{total_rows}" if total_is_exact else f"more than {total_rows}"
+        output.append(f"(showing {rows_shown} of {total} rows)")
+    return "\n".join(output) + "\n\n", metadata
 
 @tool("get_table_list", parse_docstring=True)
 def get_table_list(db_name):
@@ -22,20 +81,13 @@ def get_table_list(db_name):
         Return: 
         list of table names
     """
-    # create a cursor 
-    cursor = create_cursor(db_name)
-
-    # get table list
-    cursor.execute("SELECT name FROM sqlite_master WHERE type='table';")
-    tables = cursor.fetchall()  
-
-    # return
-    return [table[0] for table in tables]
+    # table names come from the cached schema catalog
+    return schema_catalog.get_catalog(db_name).table_names()
 
 @tool("get_table_schema", parse_docstring=True)
 def get_table_schema(table_list, db_name):
     """ 
-        This tool fetches table schema and a connetion to the database. It will return column names, column data types, default values. 
+        This tool fetches table schema and a connetion to the database. It will return column names, column data types, default values, foreign keys and indexes. 
 
         Args: 
         table_list = list of table names
@@ -44,33 +96,8 @@ def get_table_schema(table_list, db_name):
         Return: 
         A string containing schema of tables in the table_list
     """
-    # create a cursor 
-    cursor = create_cursor(db_name)
-
-    # get table info
-    output_string = ""
-    for table in table_list: 
-        cursor.execute(f"PRAGMA table_info({table});")
-        column_list = cursor.fetchall()  
-    
-        # constructing output 
-        constructed_tbl_info = ""
-        if len(column_list) == 0: 
-            field_names = "Table is not found. Try a different name."
-        else:
-            field_names = " | ".join([column[0] for column in cursor.description])
-            for column in column_list: 
-                cid = column[0]
-                name = column[1]
-                type = column[2]
-                notnull =  "True" if column[3] == 1 else "False"
-                default_value = column[4]
-                pk = "Primary Key" if column[5] == 1 else "Not PK"
-                constructed_tbl_info += f"\t{cid} | {name} | {type} | {notnull} | {default_value} | {pk} \n"
-
-        output_string += f"""Table name: {table}\n\t{field_names}\n{constructed_tbl_info}\n"""
-
-    return output_string
+    # columns, foreign keys and indexes come from the cached schema catalog
+    return schema_catalog.get_catalog(db_name).render(table_list)
 
 ## tool for running query 
 @tool("running_query", parse_docstring=True)
@@ -83,25 +110,23 @@ def running_query(query:str, db_name:str):
         db_name = location of the database to which the query will be executed
 
         Return: 
-        result of the query in string.
+        result of the query in string, limited to QUERY_MAX_ROWS rows and QUERY_MAX_BYTES bytes.
     """
-    # creating cursor
-    cursor = create_cursor(db_name)
+    # repeated queries against an unchanged database are served from the cache
+    cache_key = query_cache.result_key(query, db_name)
+    cached = query_cache.result_cache.get(cache_key)
+    if cached is not None:
+        return cached
 
-    # executing the query
-    cursor.execute(query)
-    query_result = cursor.fetchall()
+    # borrow a pooled connection
+    with get_pool(db_name).connection() as connection:
+        cursor = connection.cursor()
 
-    # constructing output 
-    data_string = ""
-    if len(query_result) == 0: 
-        field_names = "No data is returned."
-    else:
-        field_names = " | ".join([column[0] for column in cursor.description])
-        for record in query_result: 
-            data_string += " | ".join([str(cell) for cell in record]) + "\n"
+        # executing the query and streaming a bounded result
+        cursor.execute(query)
+        output_string, _ = format_query_result(cursor)
 
-    output_string = f"""{field_names}\n{data_string}\n"""
+    query_cache.result_cache.set(cache_key, output_string)
     return output_string
 
 
@@ -112,12 +137,16 @@ from langgraph.graph import MessagesState
 from typing import Any, Annotated, Literal
 from langchain_core.messages import AIMessage, HumanMessage, ToolMessage, SystemMessage
 from langgraph.graph import StateGraph, START, END
+from langchain_core.runnables import RunnableLambda
+from langgraph.constants import TAG_NOSTREAM
 from langchain_core.messages import HumanMessage, SystemMessage, AIMessage
 
 # expand the MessagesState
 class DBGraphState(MessagesState):
     db_name: Annotated[Any, "Database location"]
     user_question: Annotated[str, "User question that must be answered by querying the database"]
+    sql_query: Annotated[str, "SQL extracted from the last write_query response"]
+    sql_error: Annotated[str, "Why the local validation rejected sql_query, empty when it passed"]
 
 # the first node
 def list_tables(state: DBGraphState):
@@ -136,8 +165,7 @@ def list_tables(state: DBGraphState):
     return {'messages': response}
 
 # the second node
-def get_schema_node(state: DBGraphState):
-    
+def schema_prompt(state: DBGraphState):
     input_question = state["user_question"]
     available_tables = state["messages"][-1]
     db_name = state["db_name"]
@@ -146,16 +174,45 @@ def get_schema_node(state: DBGraphState):
                                 db_name = {db_name}
                                 Here is the question from the user: {input_question}''')
                     ] + [available_tables]
-    model_with_tools = model.bind_tools([get_table_schema], tool_choice="any")
-    response = model_with_tools.invoke(instruction)
+    return instruction
+
+def get_schema_node(state: DBGraphState):
+    model_with_tools = get_model().bind_tools([get_table_schema], tool_choice="any")
+    response = model_with_tools.invoke(schema_prompt(state))
 
     # invoking tool 
     return {"messages": response}
 
+async def aget_schema_node(state: DBGraphState):
+    model_with_tools = get_model().bind_tools([get_table_schema], tool_choice="any")
+    return {"messages": await model_with_tools.ainvoke(schema_prompt(state))}
+
 invoking_tool_node = ToolNode([get_table_schema], name="invoking_tool_node")
+
+# shortcut node, used instead of the three nodes above when the schema catalog is warm
+def load_cached_schema(state: DBGraphState):
+    schema = schema_catalog.get_catalog(state["db_name"]).render()
+    return {"messages": AIMessage(content=f"Database schema:\n{schema}")}
+
+# shortcut node for a question that was already answered, skips schema loading and write_query
+def use_cached_sql(state: DBGraphState):
+    db_name = state.get("db_name") or DB_PATH
+    query = query_cache.get_sql(state["user_question"], db_name)
+    schema = schema_catalog.get_catalog(db_name).render()
+    return {"messages": [AIMessage(content=f"Database schema:\n{schema}"), AIMessage(content=f"```sql\n{query}\n```")]}
+
+# entry router
+def route_start(state: DBGraphState) -> Literal["use_cached_sql", "load_cached_schema", "get_table_list"]:
+    db_name = state.get("db_name") or DB_PATH
+    if db_name and state.get("user_question") and query_cache.get_sql(state["user_question"], db_name):
+        return "use_cached_sql"
+    if schema_catalog.is_warm(db_name):
+        return "load_cached_schema"
+    return "get_table_list"
+
 ## Let's build the node
 
-def write_query(state:DBGraphState):
+def write_query_prompt(state: DBGraphState):
     dialect = "sqlite"
     top_k = 10
     instruction = SystemMessage(content=f'''You are an agent designed to interact with a SQL database.
@@ -168,13 +225,56 @@ def write_query(state:DBGraphState):
                         examples in the database. Never query for all the columns from a specific table,
                         only ask for the relevant columns given the question.
 
-                        DO NOT make any DML statements (INSERT, UPDATE, DELETE, DROP etc.) to the database.''')
-    
-    response = model.invoke([instruction] + state["messages"])    
+                        DO NOT make any DML statements (INSERT, UPDATE, DELETE, DROP etc.) to the database.
+
+                        Respond with the SQL query only.''')
+    return [instruction] + state["messages"]
+
+def write_query(state:DBGraphState):
+    response = get_model().invoke(write_query_prompt(state))    
    
     return {"messages": response}
 
-def check_query(state: DBGraphState):
+async def awrite_query(state: DBGraphState):
+    return {"messages": await get_model().ainvoke(write_query_prompt(state))}
+
+# local validation, replaces the check_query and run_query_node LLM calls for valid queries
+def validate_sql(state: DBGraphState):
+    query = extract_sql(state["messages"][-1].content)
+    if query is None:
+        return {"sql_query": "", "sql_error": "No SELECT statement found in the response."}
+
+    db_name = state.get("db_name") or DB_PATH
+    with get_pool(db_name).connection() as connection:
+        is_valid, error = validate_query(connection, query)
+    return {"sql_query": query, "sql_error": "" if is_valid else error}
+
+def route_validation(state: DBGraphState) -> Literal["execute_query", "check_query"]:
+    if state.get("sql_query") and not state.get("sql_error"):
+        return "execute_query"
+    # fall back to the LLM checker, which also explains forbidden queries
+    return "check_query"
+
+def execute_query(state: DBGraphState):
+    db_name = state.get("db_name") or DB_PATH
+    tool_call = {
+        "name": "running_query",
+        "args": {
+            "query": state["sql_query"],
+            "db_name": db_name
+        },
+        "id": f"fastpath-{len(state['messages'])}",
+        "type": "tool_call"
+    }
+    tool_call_message = AIMessage(content="", tool_calls=[tool_call])
+    try:
+        tool_message = running_query.invoke(tool_call)
+    except Exception as e:
+        tool_message = ToolMessage(content=f"Query failed: {e}", tool_call_id=tool_call["id"])
+
+    return {"messages": [tool_call_message, tool_message]}
+
+def check_query_prompt(state: DBGraphState):
     dialect = 'sqlite'
     instruction = SystemMessage(content=f'''You are a SQL expert with a strong attention to detail.
     Double check the {dialect} query for common mistakes, including:
@@ -192,22 +292,29 @@ def check_query(state: DBGraphState):
 
     Forbid any DML statements (INSERT, UPDATE, DELETE, DROP, TRUNCATE). If the query statement contains those statements, respond by "Forbidden query"
     ''')
-    
-    response = model.invoke([instruction] + state["messages"])    
+    return [instruction] + state["messages"]
+
+def check_query(state: DBGraphState):
+    response = get_model().invoke(check_query_prompt(state))    
     return {"messages": response}
 
-def run_query_node(state:DBGraphState):
+async def acheck_query(state: DBGraphState):
+    return {"messages": await get_model().ainvoke(check_query_prompt(state))}
+
+def run_query_prompt(state: DBGraphState):
     query_checking_result = state["messages"][-1]
     dialect = 'sqlite'
-    db_name = DB_PATH
+    db_name = state.get("db_name") or DB_PATH
     instruction = [SystemMessage(content=f'''If the last node is resulted in a forbidden query, proceed to the next node, explain why it is forbidden and skip calling tool.
                                  If the result is a valid {dialect} query statement, run the query by calling the given tool.
                                 database_name = {db_name}
                                 '''), query_checking_result]
-    
+    return instruction
+
+def run_query_node(state:DBGraphState):
     # Let the model decide 
-    model_with_tools = model.bind_tools([running_query])
-    model_response = model_with_tools.invoke(instruction)
+    model_with_tools = get_model().bind_tools([running_query])
+    model_response = model_with_tools.invoke(run_query_prompt(state))
     
     response = [model_response]
     
@@ -222,7 +329,16 @@ def run_query_node(state:DBGraphState):
 
     return {"messages": response}
 
-def final_answer(state:DBGraphState):
+async def arun_query_node(state: DBGraphState):
+    model_response = await get_model().bind_tools([running_query]).ainvoke(run_query_prompt(state))
+    response = [model_response]
+    for tool_call in model_response.tool_calls:
+        # the tool runs its SQLite query in a worker thread
+        tool_invocation_result = await running_query.ainvoke(tool_call['args'])
+        response.append(ToolMessage(content=tool_invocation_result, tool_call_id=tool_call["id"]))
+    return {"messages": response}
+
+def final_answer_prompt(state: DBGraphState):
     user_question = state['user_question']
     query_result = state['messages'][-1]
     instruction= [SystemMessage(content=f'''Decide whether you can answer user question from the query result. If you have enough information, 
@@ -231,12 +347,18 @@ def final_answer(state:DBGraphState):
                                Here is the user question: {user_question}
                                Here is the query result: \n {query_result}
                                ''')]
-    response = model.invoke(instruction)
+    return instruction
+
+def final_answer(state:DBGraphState):
+    response = get_model().invoke(final_answer_prompt(state))
 
     return {"messages": response}
 
+async def afinal_answer(state: DBGraphState):
+    return {"messages": await get_model().ainvoke(final_answer_prompt(state))}
+
 # conditional node
-def is_enough(state:DBGraphState) -> Literal['write_query', END]:
+def is_enough_prompt(state: DBGraphState):
     user_question = state['user_question']
     last_responses = state['messages'][-3:]
     instruction = [SystemMessage(content=f"""Answer only with 'enough' or 'not enough'. Answer with 'enough', if your response indicate that 
@@ -244,30 +366,60 @@ def is_enough(state:DBGraphState) -> Literal['write_query', END]:
                                 the user asks you to perform a forbidden query. Answer with 'not enough' if otherwise.
                                 User question = {user_question}""")
                                 ] + last_responses
+    return instruction
 
-    response = model.invoke(instruction)
-    response.content
+def route_enough(state: DBGraphState, response) -> Literal['write_query', END]:
+    user_question = state['user_question']
     if response.content == 'enough':
+        # remember SQL that passed local validation and answered the question
+        if state.get("sql_query") and not state.get("sql_error"):
+            query_cache.set_sql(user_question, state.get("db_name") or DB_PATH, state["sql_query"])
         return END
     else:
         return "write_query"
 
-graph = (
-    StateGraph(DBGraphState)
-    .add_node("get_table_list", list_tables)
-    .add_node(get_schema_node)
-    .add_node(invoking_tool_node, "invoking_tool_node")
-    .add_node(write_query)
-    .add_node(check_query)
-    .add_node(run_query_node)
-    .add_node(final_answer)
-    .add_edge(START, "get_table_list")
-    .add_edge("get_table_list","get_schema_node")
-    .add_edge("get_schema_node","invoking_tool_node")
-    .add_edge("invoking_tool_node", "write_query")
-    .add_edge("write_query", "check_query")
-    .add_edge("check_query", "run_query_node")
-    .add_edge("run_query_node", "final_answer")
-    .add_conditional_edges("final_answer", is_enough)
-    .compile(name = "DBQNA")    
-)
\ No newline at end of file
+# the verdict runs under the final_answer node and must not be streamed as part of the answer
+def is_enough(state:DBGraphState) -> Literal['write_query', END]:
+    response = get_model().invoke(is_enough_prompt(state), config={"tags": [TAG_NOSTREAM]})
+    return route_enough(state, response)
+
+async def ais_enough(state: DBGraphState) -> Literal['write_query', END]:
+    return route_enough(state, await get_model().ainvoke(is_enough_prompt(state), config={"tags": [TAG_NOSTREAM]}))
+
+def build_graph():
+    # LLM nodes get async variants for ainvoke/astream; the SQLite-only nodes stay synchronous,
+    # LangGraph runs those in its thread pool under astream
+    return (
+        StateGraph(DBGraphState)
+        .add_node("get_table_list", list_tables)
+        .add_node("get_schema_node", RunnableLambda(get_schema_node, afunc=aget_schema_node))
+        .add_node(invoking_tool_node, "invoking_tool_node")
+        .add_node("write_query", RunnableLambda(write_query, afunc=awrite_query))
+        .add_node("check_query", RunnableLambda(check_query, afunc=acheck_query))
+        .add_node("run_query_node", RunnableLambda(run_query_node, afunc=arun_query_node))
+        .add_node("final_answer", RunnableLambda(final_answer, afunc=afinal_answer))
+        .add_node(load_cached_schema)
+        .add_node(validate_sql)
+        .add_node(execute_query)
+        .add_node(use_cached_sql)
+        .add_conditional_edges(START, route_start)
+        .add_edge("get_table_list","get_schema_node")
+        .add_edge("get_schema_node","invoking_tool_node")
+        .add_edge("invoking_tool_node", "write_query")
+        .add_edge("load_cached_schema", "write_query")
+        .add_edge("use_cached_sql", "validate_sql")
+        .add_edge("write_query", "validate_sql")
+        .add_conditional_edges("validate_sql", route_validation)
+        .add_edge("check_query", "run_query_node")
+        .add_edge("run_query_node", "final_answer")
+        .add_edge("execute_query", "final_answer")
+        .add_conditional_edges("final_answer", RunnableLambda(is_enough, afunc=ais_enough), ["write_query", END])
+        .compile(name = "DBQNA")    
+    )
+
+# `agents.DBQNA.graph` keeps working, built through the registry on first access
+def __getattr__(name):
+    if name == "graph":
+        from agents.registry import get_graph
+        return get_graph("DBQNA")
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
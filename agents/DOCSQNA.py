@@ -1,10 +1,25 @@
-from langchain_openai import OpenAIEmbeddings, ChatOpenAI
 from langgraph.graph import START, END, StateGraph
-from typing import List, Literal
+from langgraph.constants import TAG_NOSTREAM
+from langgraph.types import Command
+from langchain_core.runnables import RunnableConfig, RunnableLambda
+from langchain_core.language_models.chat_models import BaseChatModel, agenerate_from_stream, generate_from_stream
+from langchain_core.messages import AIMessageChunk
+from langchain_core.outputs import ChatGenerationChunk, ChatResult
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, List, Literal
 from typing_extensions import TypedDict
-from pymilvus import MilvusClient
+from agents.faq_backend import get_backend, get_lexical_index
+from agents.embedding_cache import cached
+from agents.semantic_cache import answer_cache
+from agents.lexical import lexical_confident, reciprocal_rank_fusion, rerank
+from agents.llm import get_chat_model, get_embeddings_model as get_openai_embeddings
 from dotenv import load_dotenv
+from functools import lru_cache
+import asyncio
+import contextvars
 import os
+import queue
+import threading
 load_dotenv()
 
 class Message(TypedDict):
@@ -17,20 +32,35 @@ class QnaState(TypedDict):
     query:str
     answer:str 
     improve_count: int  # Track how many times we've improved the query
+    cache_hit: bool  # True when the answer came from the semantic cache
+    lexical: bool  # True when BM25 alone answers the question, so it is cached by its text
 
-OPENAI_API_KEY = os.environ.get('OPENAI_API_KEY')
 GPT_MODEL = os.environ.get('GPT_MODEL')
+# start generate_response while result_judge is still deciding
+SPECULATIVE = os.environ.get('DOCSQNA_SPECULATIVE', '0') == '1'
+# fetch several candidates and keep the best few after local re-ranking
+RETRIEVE_TOP_K = int(os.environ.get('RETRIEVE_TOP_K', '8'))
+RERANK_TOP_N = int(os.environ.get('RERANK_TOP_N', '3'))
+RERANK_ALPHA = float(os.environ.get('RERANK_ALPHA', '0.6'))
 
-embeddings_model = OpenAIEmbeddings(openai_api_key=OPENAI_API_KEY)
+# the embedding client is created on first use, not at import
+@lru_cache(maxsize=None)
+def get_embeddings_model():
+    embeddings = get_openai_embeddings()
+    # repeated queries (improve loop retries, popular questions) are served from the cache
+    return cached(embeddings, model_name=embeddings.model)
+
+# every node shares one pooled client instead of building its own per call
+def get_llm():
+    return get_chat_model(GPT_MODEL) if GPT_MODEL else get_chat_model()
 
 def get_embedding(text):
-    return embeddings_model.embed_query(text)
+    return get_embeddings_model().embed_query(text)
 
-def improve_query(state: QnaState):
+def improve_prompt(state: QnaState):
     history = state['messages']
     query = state.get('query') or state['messages'][-1]['content']
-    llm = ChatOpenAI(model=GPT_MODEL, api_key=OPENAI_API_KEY)
-    prompt = f"""
+    return f"""
     You are an expert assistant for Dexa Medica. The following is a chat history between a user and the assistant. The user's latest query did not return good results from the knowledge base. Please rewrite or expand the user's query to make it clearer and more likely to retrieve relevant information. Use the chat history for context if needed.
 
     Chat history:
@@ -41,17 +71,23 @@ def improve_query(state: QnaState):
 
     Improved query:
     """
-    improved_query = llm.invoke(prompt).content.strip()
+
+def improve_query(state: QnaState):
+    llm = get_llm()
+    improved_query = llm.invoke(improve_prompt(state)).content.strip()
     # Increment improve_count, or set to 1 if not present
     improve_count = state.get('improve_count', 0) + 1
     return {"query": improved_query, "improve_count": improve_count}
 
-def result_judge(state: QnaState) -> Literal["respond", "improve"]:
+async def aimprove_query(state: QnaState):
+    improved_query = (await get_llm().ainvoke(improve_prompt(state))).content.strip()
+    return {"query": improved_query, "improve_count": state.get('improve_count', 0) + 1}
+
+def judge_prompt(state: QnaState):
     history = state['messages']
     content = history[-1]['content']
     matches = state['matches']
-    llm = ChatOpenAI(model=GPT_MODEL, api_key=OPENAI_API_KEY)
-    prompt = f"""
+    return f"""
     You are an expert assistant for Dexa Medica. Given the user's query and the retrieved Q&A matches from the knowledge base, judge if any of the matches are relevant and sufficiently answer the user's query. Be strict: only return True if at least one match directly and clearly addresses the user's question. Otherwise, return False.
 
     Chat History:
@@ -65,7 +101,8 @@ def result_judge(state: QnaState) -> Literal["respond", "improve"]:
 
     Does at least one match sufficiently answer the user's query? Answer with True or False only.
     """
-    result = llm.invoke(prompt).content.strip()
+
+def route_judgement(state: QnaState, result: str) -> Literal["respond", "improve"]:
     is_relevant = result.lower().startswith("true")
     if is_relevant:
         return "respond"
@@ -76,33 +113,103 @@ def result_judge(state: QnaState) -> Literal["respond", "improve"]:
         else:
             return "improve"
 
-def retrieve_answer(state:QnaState):
-    query = state.get('query') or state['messages'][-1]['content']
-    query_embedding = get_embedding(query)
+def result_judge(state: QnaState) -> Literal["respond", "improve"]:
+    llm = get_llm()
+    result = llm.invoke(judge_prompt(state)).content.strip()
+    return route_judgement(state, result)
 
-    client = MilvusClient(
-        uri = 'http://192.168.76.22:19531',
-        db_name = 'digicamp_ai_miniproject',
-    )
-    results = client.search(
-        collection_name='Allen_IU_MiniProject',
-        data=[query_embedding],
-        anns_field='vector',
-        limit=1,
-        include=['question', 'answer'],
-        output_fields=['question', 'answer'],
-    )
+async def aresult_judge(state: QnaState) -> Literal["respond", "improve"]:
+    result = (await get_llm().ainvoke(judge_prompt(state))).content.strip()
+    return route_judgement(state, result)
+
+def select_matches(state: QnaState, query, records, lexical_hits, results=None):
+    if results is None:
+        # keyword-heavy query (product names, Indonesian terms): BM25 alone, no embedding call
+        candidates = [records[i] for i, _ in lexical_hits]
+    else:
+        dense = [item['entity'] for result in results for item in result]
+        by_question = {entity['question']: entity for entity in dense + [records[i] for i, _ in lexical_hits]}
+        fused = reciprocal_rank_fusion([[entity['question'] for entity in dense], [records[i]['question'] for i, _ in lexical_hits]])
+        candidates = [by_question[question] for question, _ in fused[:RETRIEVE_TOP_K]]
+    best = rerank(query, candidates, lambda entity: f"{entity['question']} {entity['answer']}", top_n=RERANK_TOP_N, alpha=RERANK_ALPHA)
 
-    matches = [f"Question: {item['entity']['question']}, Answer: {item['entity']['answer']}" for result in results for item in result]
+    matches = [f"Question: {entity['question']}, Answer: {entity['answer']}" for entity in best]
 
     improve_count = state.get('improve_count', 0)
     return {"matches":matches, "improve_count": improve_count}
 
-def generate_response(state:QnaState):
+def retrieve_answer(state:QnaState):
+    query = state.get('query') or state['messages'][-1]['content']
+
+    records, lexical = get_lexical_index()
+    lexical_hits = lexical.search(query, RETRIEVE_TOP_K)
+    results = None
+    if not lexical_confident(lexical, query, lexical_hits):
+        # Milvus or the in-process matrix, depending on FAQ_BACKEND
+        results = get_backend().search([get_embedding(query)], limit=RETRIEVE_TOP_K, output_fields=['question', 'answer'])
+    return select_matches(state, query, records, lexical_hits, results)
+
+async def aretrieve_answer(state: QnaState):
+    query = state.get('query') or state['messages'][-1]['content']
+
+    # rebuilding the lexical index may query Milvus, so it runs in a worker thread
+    records, lexical = await asyncio.to_thread(get_lexical_index)
+    lexical_hits = lexical.search(query, RETRIEVE_TOP_K)
+    results = None
+    if not lexical_confident(lexical, query, lexical_hits):
+        embedding = await get_embeddings_model().aembed_query(query)
+        results = await get_backend().asearch([embedding], limit=RETRIEVE_TOP_K, output_fields=['question', 'answer'])
+    return select_matches(state, query, records, lexical_hits, results)
+
+def is_lexical(question: str) -> bool:
+    """ True when BM25 alone answers the question, which then never needs an embedding. """
+    _, lexical = get_lexical_index()
+    return lexical_confident(lexical, question, lexical.search(question, RETRIEVE_TOP_K))
+
+def check_cache(state: QnaState):
+    # only standalone questions are cached, an answer inside a conversation may depend on the history
+    if len(state['messages']) != 1:
+        return {"cache_hit": False, "lexical": False}
+    question = state['messages'][-1]['content']
+    lexical = is_lexical(question)
+    # keyword questions are cached by their text, others by their embedding, which retrieve_answer reuses on a miss
+    answer = answer_cache.lookup_text(question) if lexical else answer_cache.lookup(get_embedding(question))
+    if answer is None:
+        return {"cache_hit": False, "lexical": lexical}
+    return {"answer": answer, "cache_hit": True, "lexical": lexical}
+
+async def acheck_cache(state: QnaState):
+    if len(state['messages']) != 1:
+        return {"cache_hit": False, "lexical": False}
+    question = state['messages'][-1]['content']
+    # rebuilding the lexical index may query Milvus, so it runs in a worker thread
+    lexical = await asyncio.to_thread(is_lexical, question)
+    answer = answer_cache.lookup_text(question) if lexical else answer_cache.lookup(await get_embeddings_model().aembed_query(question))
+    if answer is None:
+        return {"cache_hit": False, "lexical": lexical}
+    return {"answer": answer, "cache_hit": True, "lexical": lexical}
+
+def route_cache(state: QnaState) -> Literal["hit", "miss"]:
+    return "hit" if state.get('cache_hit') else "miss"
+
+def store_answer(state: QnaState):
+    # skip answers produced after the improve loop gave up
+    if len(state['messages']) == 1 and state.get('improve_count', 0) < 3 and state.get('answer'):
+        question = state['messages'][-1]['content']
+        answer_cache.store(None if state.get('lexical') else get_embedding(question), question, state['answer'])
+    return {}
+
+async def astore_answer(state: QnaState):
+    if len(state['messages']) == 1 and state.get('improve_count', 0) < 3 and state.get('answer'):
+        question = state['messages'][-1]['content']
+        vector = None if state.get('lexical') else await get_embeddings_model().aembed_query(question)
+        answer_cache.store(vector, question, state['answer'])
+    return {}
+
+def response_prompt(state: QnaState):
     history = state['messages']
     query = history[-1]['content']
-    llm = ChatOpenAI(model=GPT_MODEL, api_key=OPENAI_API_KEY)
-    prompt = f"""
+    return f"""
     You are a knowledgeable assistant specializing in Dexa Medica. Given the user's query and the full chat history, carefully analyze the context and select the most relevant Q&A pairs from the knowledge base that best address the user's needs. Write it in a user friendly way, copy paste the answer if necessary as long as it's written in a format easy to understand by user. ONLY USE THE GIVEN RAG ANSWER VALUE IN RAG RESULT FOR YOUR RESPONSE AND NEVER ADD ANY INFORMATION THAT IS NOT IN IT
 
     Chat history:
@@ -116,25 +223,166 @@ def generate_response(state:QnaState):
 
     Answer:
     """
-    return {"answer": llm.invoke(prompt).content, "improve_count": state.get('improve_count', 0)}
-
-workflow = StateGraph(QnaState)
-
-#Define functions
-workflow.add_node('retrieve', retrieve_answer)
-workflow.add_node('improve', improve_query)
-workflow.add_node('respond', generate_response)
-
-#Define edge/route
-workflow.add_edge(START, 'retrieve')
-workflow.add_conditional_edges(
-    'retrieve',
-    result_judge,{
-        "respond":"respond",
-        "improve":"improve"
-    }
-)
-workflow.add_edge('improve', 'retrieve')
-workflow.add_edge('respond',END)
-
-graph = workflow.compile()
\ No newline at end of file
+
+def generate_response(state:QnaState):
+    llm = get_llm()
+    return {"answer": llm.invoke(response_prompt(state)).content, "improve_count": state.get('improve_count', 0)}
+
+async def agenerate_response(state: QnaState):
+    answer = (await get_llm().ainvoke(response_prompt(state))).content
+    return {"answer": answer, "improve_count": state.get('improve_count', 0)}
+
+# Speculative mode: judge and generation run at the same time
+_speculation_pool = ThreadPoolExecutor(max_workers=int(os.environ.get('SPECULATION_WORKERS', '8')), thread_name_prefix="docsqna-speculation")
+
+class _DraftRelay(BaseChatModel):
+    """
+        Replays the chunks of a draft generated elsewhere as this model's own tokens, so LangGraph's
+        messages stream shows an accepted draft as the respond node's output. `drafts` is a
+        queue.Queue (sync) or asyncio.Queue (async) of chunk texts, ended by None; an exception
+        put on it is raised.
+    """
+
+    drafts: Any
+
+    @property
+    def _llm_type(self) -> str:
+        return "draft-relay"
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        return generate_from_stream(self._stream(messages, stop, run_manager, **kwargs))
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        return await agenerate_from_stream(self._astream(messages, stop, run_manager, **kwargs))
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        while (text := self.drafts.get()) is not None:
+            if isinstance(text, BaseException):
+                raise text
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=text))
+            if run_manager:
+                run_manager.on_llm_new_token(text, chunk=chunk)
+            yield chunk
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        while (text := await self.drafts.get()) is not None:
+            if isinstance(text, BaseException):
+                raise text
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=text))
+            if run_manager:
+                await run_manager.on_llm_new_token(text, chunk=chunk)
+            yield chunk
+
+def _stream_answer(llm, prompt, drafts: queue.Queue, cancel: threading.Event, config: RunnableConfig):
+    # the draft is kept out of the message stream and buffered until the judge accepts it
+    try:
+        for chunk in llm.with_config(tags=[TAG_NOSTREAM]).stream(prompt, config=config):
+            # leaving the loop closes the HTTP stream, so a rejected generation stops costing tokens
+            if cancel.is_set():
+                return
+            drafts.put(chunk.content)
+    except Exception as e:
+        drafts.put(e)
+    finally:
+        drafts.put(None)
+
+def speculative_respond(state: QnaState, config: RunnableConfig) -> Command[Literal["improve", "store_answer"]]:
+    llm = get_llm()
+    cancel = threading.Event()
+    drafts = queue.Queue()
+    prompt = response_prompt(state)
+    # the answer is generated while the judge decides, and only shown once it is accepted
+    _speculation_pool.submit(contextvars.copy_context().run, _stream_answer, llm, prompt, drafts, cancel, config)
+    try:
+        # the verdict itself is not part of the answer stream
+        verdict = llm.invoke(judge_prompt(state), config={"tags": [TAG_NOSTREAM]}).content.strip()
+    except BaseException:
+        cancel.set()
+        raise
+
+    if route_judgement(state, verdict) == "improve":
+        cancel.set()
+        return Command(goto="improve")
+    try:
+        # the chunks buffered while the judge ran are flushed at once, the rest stream as they arrive
+        answer = _DraftRelay(drafts=drafts).invoke(prompt, config).content
+    finally:
+        cancel.set()
+    return Command(goto="store_answer", update={"answer": answer, "improve_count": state.get('improve_count', 0)})
+
+async def _astream_answer(llm, prompt, drafts: asyncio.Queue, config: RunnableConfig):
+    try:
+        async for chunk in llm.with_config(tags=[TAG_NOSTREAM]).astream(prompt, config=config):
+            drafts.put_nowait(chunk.content)
+    except Exception as e:
+        drafts.put_nowait(e)
+    finally:
+        drafts.put_nowait(None)
+
+async def aspeculative_respond(state: QnaState, config: RunnableConfig) -> Command[Literal["improve", "store_answer"]]:
+    llm = get_llm()
+    drafts = asyncio.Queue()
+    prompt = response_prompt(state)
+    # under astream the generation is a task on the same event loop instead of a pool thread
+    generation = asyncio.create_task(_astream_answer(llm, prompt, drafts, config))
+    try:
+        verdict = (await llm.ainvoke(judge_prompt(state), config={"tags": [TAG_NOSTREAM]})).content.strip()
+    except BaseException:
+        generation.cancel()
+        raise
+
+    if route_judgement(state, verdict) == "improve":
+        # cancelling the task closes the HTTP stream
+        generation.cancel()
+        return Command(goto="improve")
+    try:
+        answer = (await _DraftRelay(drafts=drafts).ainvoke(prompt, config)).content
+    finally:
+        generation.cancel()
+    return Command(goto="store_answer", update={"answer": answer, "improve_count": state.get('improve_count', 0)})
+
+def build_graph(speculative: bool = SPECULATIVE):
+    workflow = StateGraph(QnaState)
+
+    #Define functions, each with an async variant used by ainvoke/astream
+    workflow.add_node('retrieve', RunnableLambda(retrieve_answer, afunc=aretrieve_answer))
+    workflow.add_node('improve', RunnableLambda(improve_query, afunc=aimprove_query))
+    if speculative:
+        workflow.add_node('respond', RunnableLambda(speculative_respond, afunc=aspeculative_respond), destinations=('improve', 'store_answer'))
+    else:
+        workflow.add_node('respond', RunnableLambda(generate_response, afunc=agenerate_response))
+    workflow.add_node('check_cache', RunnableLambda(check_cache, afunc=acheck_cache))
+    workflow.add_node('store_answer', RunnableLambda(store_answer, afunc=astore_answer))
+
+    #Define edge/route
+    workflow.add_edge(START, 'check_cache')
+    workflow.add_conditional_edges(
+        'check_cache',
+        route_cache,{
+            "hit": END,
+            "miss": "retrieve"
+        }
+    )
+    if speculative:
+        # respond judges the matches itself and jumps to improve when they are rejected
+        workflow.add_edge('retrieve', 'respond')
+    else:
+        workflow.add_conditional_edges(
+            'retrieve',
+            RunnableLambda(result_judge, afunc=aresult_judge),{
+                "respond":"respond",
+                "improve":"improve"
+            }
+        )
+        workflow.add_edge('respond','store_answer')
+    workflow.add_edge('improve', 'retrieve')
+    workflow.add_edge('store_answer',END)
+
+    return workflow.compile(name="DOCSQNA")
+
+# `agents.DOCSQNA.graph` keeps working, built through the registry on first access
+def __getattr__(name):
+    if name == "graph":
+        from agents.registry import get_graph
+        return get_graph("DOCSQNA")
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -1,7 +1,8 @@
-from langchain.chat_models import init_chat_model
-from langchain_huggingface import HuggingFaceEmbeddings
-from langchain_core.vectorstores import InMemoryVectorStore
+import threading
+from functools import lru_cache
+from agents.llm import get_chat_model, get_local_embeddings_model
 from langchain_core.tools import tool
+from langchain_core.runnables import RunnableLambda
 from langgraph.graph import MessagesState, StateGraph
 from langchain_core.messages import SystemMessage
 from langgraph.prebuilt import ToolNode
@@ -12,28 +13,50 @@ from langgraph.prebuilt import ToolNode, tools_condition
 from dotenv import load_dotenv
 load_dotenv(override=True)
 
-embedding_model = HuggingFaceEmbeddings(model_name="intfloat/multilingual-e5-large-instruct")
-vector_store = InMemoryVectorStore(embedding_model)
-
-file_path = "./docs/Tentang Dexa Medica.pdf"
-
+from agents.index_store import indexed_files, load_or_build_index, manifest_version
 from langchain_community.document_loaders import PyPDFLoader
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 
-loader = PyPDFLoader(file_path)
-docs = loader.load()
+EMBEDDING_MODEL_NAME = "intfloat/multilingual-e5-large-instruct"
+file_path = "./docs/Tentang Dexa Medica.pdf"
+
 text_splitter = RecursiveCharacterTextSplitter(
     chunk_size=500, chunk_overlap=100
 )
-all_splits = text_splitter.split_documents(docs)
-vector_store.add_documents(all_splits)
 
+# Heavy objects are created on first use, not at import
+@lru_cache(maxsize=None)
+def get_embedding_model():
+    return get_local_embeddings_model(EMBEDDING_MODEL_NAME)
+
+_vector_store = None  # (manifest version, DocumentIndex)
+_vector_store_lock = threading.Lock()
+
+def get_vector_store():
+    # vectors are embedded once per document version and memory-mapped from ./index afterwards
+    # the company profile plus any document added by ingest_service.py, reloaded when the manifest changes
+    global _vector_store
+    with _vector_store_lock:
+        if _vector_store is None or _vector_store[0] != manifest_version():
+            index = load_or_build_index(
+                [file_path] + indexed_files(),
+                load_documents=lambda path: PyPDFLoader(path).load(),
+                text_splitter=text_splitter,
+                embedding_model=get_embedding_model(),
+                model_name=EMBEDDING_MODEL_NAME,
+            )
+            # read after the build, which may rewrite the manifest itself
+            _vector_store = (manifest_version(), index)
+        return _vector_store[1]
+
+@lru_cache(maxsize=None)
+def get_llm():
+    return get_chat_model("gpt-4.1-mini")
 
-llm = init_chat_model("gpt-4.1-mini", model_provider="openai")
 @tool(response_format="content_and_artifact")
 def retrieve(query: str):
     """Retrieve information related to a query."""
-    retrieved_docs = vector_store.similarity_search(query, k=5)
+    retrieved_docs = get_vector_store().hybrid_search(query, k=5)
     serialized = "\n\n".join(
         (f"Source: {doc.metadata}\n" f"Content: {doc.page_content}")
         for doc in retrieved_docs
@@ -43,17 +66,20 @@ def retrieve(query: str):
 # Step 1: Generate an AIMessage that may include a tool-call to be sent.
 def query_or_respond(state: MessagesState):
     """Generate tool call for retrieval or respond."""
-    llm_with_tools = llm.bind_tools([retrieve])
+    llm_with_tools = get_llm().bind_tools([retrieve])
     response = llm_with_tools.invoke(state["messages"])
     # MessagesState appends messages to state instead of overwriting
     return {"messages": [response]}
 
+async def aquery_or_respond(state: MessagesState):
+    response = await get_llm().bind_tools([retrieve]).ainvoke(state["messages"])
+    return {"messages": [response]}
+
 # Step 2: Execute the retrieval.
 tools = ToolNode([retrieve])
 
 # Step 3: Generate a response using the retrieved content.
-def generate(state: MessagesState):
-    """Generate answer."""
+def generate_prompt(state: MessagesState):
     # Get generated ToolMessages
     recent_tool_messages = []
     for message in reversed(state["messages"]):
@@ -79,25 +105,40 @@ def generate(state: MessagesState):
         if message.type in ("human", "system")
         or (message.type == "ai" and not message.tool_calls)
     ]
-    prompt = [SystemMessage(system_message_content)] + conversation_messages
+    return [SystemMessage(system_message_content)] + conversation_messages
 
+def generate(state: MessagesState):
+    """Generate answer."""
     # Run
-    response = llm.invoke(prompt)
+    response = get_llm().invoke(generate_prompt(state))
+    return {"messages": [response]}
+
+async def agenerate(state: MessagesState):
+    response = await get_llm().ainvoke(generate_prompt(state))
     return {"messages": [response]}
 
 
-graph = (
-    StateGraph(MessagesState)
-    .add_node(query_or_respond)
-    .add_node(tools)
-    .add_node(generate)
-    .set_entry_point("query_or_respond")
-    .add_conditional_edges(
-    "query_or_respond",
-        tools_condition,
-        {END: END, "tools": "tools"},
+def build_graph():
+    return (
+        StateGraph(MessagesState)
+        .add_node("query_or_respond", RunnableLambda(query_or_respond, afunc=aquery_or_respond))
+        # ToolNode is async already, the retrieve tool itself runs in a worker thread
+        .add_node(tools)
+        .add_node("generate", RunnableLambda(generate, afunc=agenerate))
+        .set_entry_point("query_or_respond")
+        .add_conditional_edges(
+        "query_or_respond",
+            tools_condition,
+            {END: END, "tools": "tools"},
+        )
+        .add_edge("tools", "generate")
+        .add_edge("generate", END)
+        .compile(name="RAG")
     )
-    .add_edge("tools", "generate")
-    .add_edge("generate", END)
-    .compile(name="RAG")
-)
\ No newline at end of file
+
+# `agents.RAG.graph` keeps working, built through the registry on first access
+def __getattr__(name):
+    if name == "graph":
+        from agents.registry import get_graph
+        return get_graph("RAG")
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,166 @@
+import asyncio
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import unicodedata
+from array import array
+
+from langchain_core.embeddings import Embeddings
+
+from agents.cache import LRUCache
+
+# optional SQLite file that keeps embeddings across restarts
+EMBEDDING_CACHE_PATH = os.environ.get('EMBEDDING_CACHE_PATH')
+EMBEDDING_CACHE_SIZE = int(os.environ.get('EMBEDDING_CACHE_SIZE', '10000'))
+
+
+# Supporting functions
+def normalize_text(text: str) -> str:
+    return re.sub(r"\s+", " ", unicodedata.normalize("NFC", text)).strip()
+
+def cache_key(model_name: str, text: str) -> str:
+    return hashlib.sha256(f"{model_name}\0{normalize_text(text)}".encode("utf-8")).hexdigest()
+
+
+class SQLiteEmbeddingStore:
+    """ Embeddings stored as float32 blobs in a SQLite table, keyed by cache_key. """
+
+    def __init__(self, path: str):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL;")
+        self._connection.execute("CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL);")
+        self._connection.commit()
+        self._lock = threading.Lock()
+
+    def get_many(self, keys: list) -> dict:
+        if not keys:
+            return {}
+        placeholders = ", ".join("?" for _ in keys)
+        with self._lock:
+            rows = self._connection.execute(f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders});", keys).fetchall()
+        return {key: array('f', blob).tolist() for key, blob in rows}
+
+    def set_many(self, items: dict):
+        if not items:
+            return
+        rows = [(key, array('f', vector).tobytes()) for key, vector in items.items()]
+        with self._lock:
+            self._connection.executemany("INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?);", rows)
+            self._connection.commit()
+
+
+class CachedEmbeddings(Embeddings):
+    """
+        Wraps an embedding model with an in-memory LRU and an optional on-disk store.
+        Texts are keyed by model name and whitespace/unicode-normalized content, so only
+        texts never seen before reach the underlying model.
+    """
+
+    def __init__(self, embeddings: Embeddings, model_name: str, store: SQLiteEmbeddingStore = None, max_entries: int = EMBEDDING_CACHE_SIZE):
+        self.embeddings = embeddings
+        self.model_name = model_name
+        self.store = store
+        self.memory = LRUCache(max_entries=max_entries)
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def embed_documents(self, texts: list) -> list:
+        keys = [cache_key(self.model_name, text) for text in texts]
+        vectors = {}
+
+        # 1. memory
+        for key in set(keys):
+            vector = self.memory.get(key)
+            if vector is not None:
+                vectors[key] = vector
+        memory_hits = len(vectors)
+
+        # 2. disk
+        missing = [key for key in set(keys) if key not in vectors]
+        disk_vectors = self.store.get_many(missing) if self.store is not None and missing else {}
+        for key, vector in disk_vectors.items():
+            self.memory.set(key, vector)
+        vectors.update(disk_vectors)
+
+        # 3. the model, once per distinct missing text
+        pending = {}
+        for key, text in zip(keys, texts):
+            if key not in vectors and key not in pending:
+                pending[key] = text
+        if pending:
+            new_vectors = self.embeddings.embed_documents(list(pending.values()))
+            computed = dict(zip(pending.keys(), new_vectors))
+            for key, vector in computed.items():
+                self.memory.set(key, vector)
+            if self.store is not None:
+                self.store.set_many(computed)
+            vectors.update(computed)
+
+        with self._lock:
+            self.memory_hits += memory_hits
+            self.disk_hits += len(disk_vectors)
+            self.misses += len(pending)
+        return [vectors[key] for key in keys]
+
+    def _lookup_query(self, key: str):
+        vector = self.memory.get(key)
+        if vector is not None:
+            with self._lock:
+                self.memory_hits += 1
+            return vector
+
+        if self.store is not None:
+            vector = self.store.get_many([key]).get(key)
+            if vector is not None:
+                self.memory.set(key, vector)
+                with self._lock:
+                    self.disk_hits += 1
+                return vector
+        return None
+
+    def _remember_query(self, key: str, vector: list):
+        self.memory.set(key, vector)
+        if self.store is not None:
+            self.store.set_many({key: vector})
+        with self._lock:
+            self.misses += 1
+
+    def embed_query(self, text: str) -> list:
+        key = cache_key(self.model_name, text)
+        vector = self._lookup_query(key)
+        if vector is None:
+            vector = self.embeddings.embed_query(text)
+            self._remember_query(key, vector)
+        return vector
+
+    async def aembed_query(self, text: str) -> list:
+        key = cache_key(self.model_name, text)
+        # the disk store is SQLite, so lookups and writes run in a worker thread
+        vector = await asyncio.to_thread(self._lookup_query, key)
+        if vector is None:
+            vector = await self.embeddings.aembed_query(text)
+            await asyncio.to_thread(self._remember_query, key, vector)
+        return vector
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.memory_hits + self.disk_hits + self.misses
+            return {
+                "model": self.model_name,
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0,
+                "memory_entries": len(self.memory),
+            }
+
+
+def cached(embeddings: Embeddings, model_name: str) -> CachedEmbeddings:
+    """ Wraps a model with the process cache, persisting to EMBEDDING_CACHE_PATH when it is set. """
+    store = SQLiteEmbeddingStore(EMBEDDING_CACHE_PATH) if EMBEDDING_CACHE_PATH else None
+    return CachedEmbeddings(embeddings, model_name, store=store)
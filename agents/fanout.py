@@ -0,0 +1,125 @@
+import asyncio
+import logging
+import os
+import re
+import threading
+
+from agents.lexical import tokenize
+
+logger = logging.getLogger(__name__)
+
+# agents queried at once when the router cannot decide
+FANOUT_AGENTS = tuple(name.strip() for name in os.environ.get('FANOUT_AGENTS', 'RAG,DOCSQNA').split(',') if name.strip())
+FANOUT_MIN_SCORE = float(os.environ.get('FANOUT_MIN_SCORE', '0.3'))
+FANOUT_TIMEOUT = float(os.environ.get('FANOUT_TIMEOUT', '60'))
+
+# answers that open by admitting the agent's source does not cover the question, optionally after an apology
+REFUSALS = re.compile(
+    r"^\W*(?:(?:mohon )?maaf|sorry|i'm sorry|i am sorry)?[\s,.!]*(?:saya |i )?"
+    r"(?:tidak tahu|tidak (?:dapat|bisa) (?:menjawab|menemukan)|tidak menemukan|tidak memiliki informasi|tidak ada informasi"
+    r"|don't know|do not know|cannot (?:answer|find)|can't (?:answer|find)|could not find|couldn't find"
+    r"|(?:don't|do not) have (?:any |enough )?information|no (?:relevant )?information)",
+    re.IGNORECASE,
+)
+# short answers that only say the information is missing, e.g. "Informasi tersebut tidak ditemukan."
+MISSING_INFORMATION = re.compile(
+    r"((?:informasi|data)\b.{0,40}\btidak (?:ditemukan|tersedia)|(?:information|data)\b.{0,40}\bnot (?:found|available))",
+    re.IGNORECASE,
+)
+REFUSAL_MAX_WORDS = 25
+
+# Supporting functions
+def agent_input(name: str, question: str) -> dict:
+    from langchain_core.messages import HumanMessage
+    if name == "DBQNA":
+        from agents.DBQNA import DB_PATH
+        return {"messages": HumanMessage(content=question), "db_name": DB_PATH, "user_question": question}
+    if name == "DOCSQNA":
+        # QnaState keeps the chat as {role, content} dicts
+        return {"messages": [{"role": "user", "content": question}]}
+    return {"messages": HumanMessage(content=question)}
+
+def agent_answer(name: str, output: dict) -> str:
+    # DOCSQNA keeps its answer in state, the message-based agents end with the answer message
+    if name == "DOCSQNA":
+        return output.get('answer', '')
+    return output['messages'][-1].content
+
+def is_refusal(answer: str) -> bool:
+    # a long answer that mentions a missing detail in passing still answers the question
+    return bool(REFUSALS.match(answer)) or (len(answer.split()) <= REFUSAL_MAX_WORDS and bool(MISSING_INFORMATION.search(answer)))
+
+def score_answer(question: str, answer: str) -> float:
+    """ 0 for an empty or refusing answer, otherwise the share of the question's terms the answer covers. """
+    if not answer or not answer.strip() or is_refusal(answer):
+        return 0.0
+    terms = set(tokenize(question))
+    if not terms:
+        return 1.0
+    return len(terms & set(tokenize(answer))) / len(terms)
+
+
+async def first_acceptable(question: str, agents=FANOUT_AGENTS, min_score: float = FANOUT_MIN_SCORE,
+                           timeout: float = FANOUT_TIMEOUT, config=None):
+    """
+        Runs the agents concurrently and returns as soon as one answer scores at least min_score;
+        the other runs are cancelled.
+
+        Args:
+        question = user question
+        agents = registry names of the agents to run
+        min_score = score_answer threshold of an acceptable answer
+        timeout = seconds to wait for all agents
+        config = RunnableConfig passed to every agent run
+
+        Return:
+        (agent, answer, score) of the first acceptable answer, otherwise of the best answer seen;
+        agent is None when every run failed
+    """
+    from agents.registry import get_graph
+
+    async def run(name):
+        output = await get_graph(name).ainvoke(agent_input(name, question), config)
+        return name, agent_answer(name, output)
+
+    tasks = [asyncio.create_task(run(name)) for name in agents]
+    best = (None, "", 0.0)
+    try:
+        for next_done in asyncio.as_completed(tasks, timeout=timeout):
+            try:
+                name, answer = await next_done
+            except asyncio.TimeoutError:
+                raise
+            except Exception as e:
+                logger.warning("fan-out agent failed: %s", e)
+                continue
+            score = score_answer(question, answer)
+            logger.info("fan-out %s answered (score=%.2f)", name, score)
+            if score >= min_score:
+                return name, answer, score
+            if best[0] is None or score > best[2]:
+                best = (name, answer, score)
+    except asyncio.TimeoutError:
+        logger.warning("fan-out timed out after %.0fs", timeout)
+    finally:
+        # slower agents stop at their next await, which also closes their LLM streams
+        for task in tasks:
+            task.cancel()
+    return best
+
+
+_loop = None
+_loop_lock = threading.Lock()
+
+def get_event_loop():
+    """ One event loop per process, running in a daemon thread, so the async HTTP pools stay warm across fan-outs. """
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name="fanout-loop", daemon=True).start()
+        return _loop
+
+def run_first_acceptable(question: str, **kwargs):
+    """ first_acceptable for synchronous callers, e.g. a Streamlit script or a sync graph node. """
+    return asyncio.run_coroutine_threadsafe(first_acceptable(question, **kwargs), get_event_loop()).result()
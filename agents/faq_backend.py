@@ -0,0 +1,144 @@
+import asyncio
+import os
+import threading
+
+import numpy as np
+
+from agents.index_store import load_matrix, matrix_version, normalize_rows, save_matrix
+from agents.lexical import BM25
+from agents.semantic_cache import read_version
+
+# 'milvus' searches the remote collection, 'local' searches an in-process matrix loaded from FAQ_INDEX_PATH
+FAQ_BACKEND = os.environ.get('FAQ_BACKEND', 'milvus')
+FAQ_INDEX_PATH = os.environ.get('FAQ_INDEX_PATH', './index/faq')
+# upper bound of a single Milvus query, enough for the whole FAQ
+MILVUS_QUERY_LIMIT = 16384
+
+
+class MilvusBackend:
+    """ Searches the FAQ collection through the shared Milvus client. """
+
+    name = "milvus"
+
+    def search(self, vectors, limit: int, output_fields=('question', 'answer')):
+        from agents.milvus_client import MILVUS_COLLECTION, call_with_retry
+        return call_with_retry(lambda client: client.search(
+            collection_name=MILVUS_COLLECTION,
+            data=[list(vector) for vector in vectors],
+            anns_field='vector',
+            limit=limit,
+            output_fields=list(output_fields),
+        ))
+
+    async def asearch(self, vectors, limit: int, output_fields=('question', 'answer')):
+        from agents.milvus_client import MILVUS_COLLECTION, acall_with_retry, supports_async
+        if not supports_async():
+            return await asyncio.to_thread(self.search, vectors, limit, output_fields)
+        return await acall_with_retry(lambda client: client.search(
+            collection_name=MILVUS_COLLECTION,
+            data=[list(vector) for vector in vectors],
+            anns_field='vector',
+            limit=limit,
+            output_fields=list(output_fields),
+        ))
+
+    def fetch_records(self, output_fields=('question', 'answer')) -> list:
+        from agents.milvus_client import MILVUS_COLLECTION, call_with_retry
+        return call_with_retry(lambda client: client.query(
+            collection_name=MILVUS_COLLECTION,
+            filter='question != ""',
+            output_fields=list(output_fields),
+            limit=MILVUS_QUERY_LIMIT,
+        ))
+
+
+class LocalBackend:
+    """
+        Searches normalized FAQ vectors held in a memory-mapped NumPy matrix.
+        Results use the same shape as MilvusClient.search: one list of hits per query vector,
+        each hit a dict with `id`, `distance` (cosine similarity) and `entity`.
+    """
+
+    name = "local"
+
+    def __init__(self, vectors, records: list, path: str = None, version: str = None):
+        self.vectors = vectors
+        self.records = records
+        self.path = path
+        self.version = version
+
+    @classmethod
+    def load(cls, path: str = FAQ_INDEX_PATH):
+        version = matrix_version(path)
+        loaded = load_matrix(path, version) if version else None
+        if loaded is None:
+            raise FileNotFoundError(f"No local FAQ index at {path}, run milvus_upload.py with FAQ_BACKEND=local first")
+        vectors, records = loaded
+        return cls(vectors, records, path, version)
+
+    @staticmethod
+    def save(records: list, vectors, path: str = FAQ_INDEX_PATH):
+        save_matrix(path, normalize_rows(vectors), records)
+
+    def is_stale(self) -> bool:
+        return self.path is not None and matrix_version(self.path) != self.version
+
+    def fetch_records(self, output_fields=('question', 'answer')) -> list:
+        return [{field: record.get(field) for field in output_fields} for record in self.records]
+
+    def search(self, vectors, limit: int, output_fields=('question', 'answer')):
+        if len(self.records) == 0:
+            return [[] for _ in vectors]
+        queries = normalize_rows(vectors)
+        # one matrix product scores every query against every FAQ entry
+        scores = queries @ self.vectors.T
+        k = min(limit, scores.shape[1])
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        results = []
+        for row, candidates in enumerate(top):
+            ordered = candidates[np.argsort(-scores[row, candidates])]
+            results.append([
+                {
+                    "id": int(i),
+                    "distance": float(scores[row, i]),
+                    "entity": {field: self.records[i].get(field) for field in output_fields},
+                }
+                for i in ordered
+            ])
+        return results
+
+    async def asearch(self, vectors, limit: int, output_fields=('question', 'answer')):
+        # a single matrix product over the FAQ, cheaper than a thread hop
+        return self.search(vectors, limit, output_fields)
+
+
+_backend = None
+_lexical = None  # (backend, corpus version, records, BM25)
+_lock = threading.Lock()
+
+def get_backend():
+    """ Returns the configured backend; the local matrix is reloaded when its file is rewritten. """
+    global _backend
+    with _lock:
+        if _backend is None or (isinstance(_backend, LocalBackend) and _backend.is_stale()):
+            _backend = LocalBackend.load() if FAQ_BACKEND == 'local' else MilvusBackend()
+        return _backend
+
+def set_backend(backend):
+    global _backend
+    with _lock:
+        _backend = backend
+
+def get_lexical_index():
+    """
+        Returns (records, BM25 over question and answer) for the current FAQ corpus. It is rebuilt
+        when the backend changes or milvus_upload.py bumps the FAQ version.
+    """
+    global _lexical
+    backend = get_backend()
+    version = read_version()
+    with _lock:
+        if _lexical is None or _lexical[0] is not backend or _lexical[1] != version:
+            records = [{'question': record['question'], 'answer': record['answer']} for record in backend.fetch_records()]
+            _lexical = (backend, version, records, BM25([f"{record['question']} {record['answer']}" for record in records]))
+        return _lexical[2], _lexical[3]
@@ -1,4 +1,4 @@
-from langchain.chat_models import init_chat_model
+from agents.llm import get_chat_model
 from langgraph.prebuilt import create_react_agent
 
 from dotenv import load_dotenv
@@ -12,10 +12,19 @@ def multiply(a: int, b: int) -> int:
     """Multiply two numbers."""
     return a * b
 
-model = init_chat_model("openai:gpt-4.1-nano", temperature=0)
 tools = [add, multiply]
-agent = create_react_agent(
-    # disable parallel tool calls
-    model=model.bind_tools(tools, parallel_tool_calls=False),
-    tools=tools
-)
\ No newline at end of file
+
+def build_graph():
+    model = get_chat_model("gpt-4.1-nano", temperature=0)
+    return create_react_agent(
+        # disable parallel tool calls
+        model=model.bind_tools(tools, parallel_tool_calls=False),
+        tools=tools
+    )
+
+# `agents.graph.agent` keeps working, built through the registry on first access
+def __getattr__(name):
+    if name == "agent":
+        from agents.registry import get_graph
+        return get_graph("simple")
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
\ No newline at end of file
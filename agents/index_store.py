@@ -0,0 +1,330 @@
+import glob
+import hashlib
+import json
+import os
+import shutil
+import uuid
+
+import numpy as np
+from langchain_core.documents import Document
+
+from agents.lexical import BM25, lexical_confident, reciprocal_rank_fusion
+
+INDEX_DIR = os.environ.get('INDEX_DIR', './index')
+MANIFEST_NAME = 'manifest.json'
+
+# Supporting functions
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def index_key(doc_hash: str, chunk_size: int, chunk_overlap: int, model_name: str) -> str:
+    # every parameter that changes the vectors is part of the key
+    params = json.dumps([doc_hash, chunk_size, chunk_overlap, model_name])
+    return hashlib.sha256(params.encode('utf-8')).hexdigest()[:32]
+
+def normalize_rows(vectors) -> np.ndarray:
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if vectors.ndim == 1:
+        vectors = vectors.reshape(1, -1)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+def save_matrix(prefix: str, vectors, records: list):
+    """
+        Writes vectors and records as a new `<prefix>.<version>.npy`/`.json` pair, then points
+        `<prefix>.current` at it. Readers follow the pointer, so they never pair the vectors of
+        one save with the records of another.
+    """
+    os.makedirs(os.path.dirname(prefix) or '.', exist_ok=True)
+    version = uuid.uuid4().hex[:16]
+    with open(f"{prefix}.{version}.npy.tmp", 'wb') as f:
+        np.save(f, np.asarray(vectors, dtype=np.float32))
+    with open(f"{prefix}.{version}.json.tmp", 'w', encoding='utf-8') as f:
+        json.dump(records, f, ensure_ascii=False)
+    _publish(prefix, version)
+
+def _publish(prefix: str, version: str):
+    # the .tmp names keep a concurrent save from pruning a pair that is still being written
+    for ext in ('npy', 'json'):
+        os.replace(f"{prefix}.{version}.{ext}.tmp", f"{prefix}.{version}.{ext}")
+    with open(f"{prefix}.current.tmp", 'w', encoding='utf-8') as f:
+        f.write(version)
+    os.replace(f"{prefix}.current.tmp", f"{prefix}.current")
+    _remove_versions(prefix, keep=version)
+
+def _remove_versions(prefix: str, keep: str = None):
+    for ext in ('npy', 'json'):
+        for path in glob.glob(f"{glob.escape(prefix)}.*.{ext}"):
+            if path != f"{prefix}.{keep}.{ext}":
+                try:
+                    os.remove(path)
+                except OSError:
+                    # still mapped by a reader on a platform that refuses; the next save retries
+                    pass
+
+def remove_matrix(prefix: str):
+    if os.path.exists(f"{prefix}.current"):
+        os.remove(f"{prefix}.current")
+    _remove_versions(prefix)
+
+def matrix_version(prefix: str):
+    """ Version `<prefix>.current` points at, None if the matrix was never saved. """
+    try:
+        with open(f"{prefix}.current", encoding='utf-8') as f:
+            return f.read().strip()
+    except FileNotFoundError:
+        return None
+
+def load_matrix(prefix: str, version: str = None):
+    """ Returns (memory-mapped vectors, records) of the given or current version, or None if the files are missing. """
+    for _ in range(3):
+        current = version or matrix_version(prefix)
+        if current is None:
+            return None
+        try:
+            vectors = np.load(f"{prefix}.{current}.npy", mmap_mode='r')
+            with open(f"{prefix}.{current}.json", encoding='utf-8') as f:
+                records = json.load(f)
+            return vectors, records
+        except FileNotFoundError:
+            if version is not None:
+                return None
+            # a concurrent save replaced this version after we read the pointer
+    return None
+
+
+class MatrixWriter:
+    """
+        Builds a `save_matrix` pair batch by batch, holding only the current batch in memory.
+        Rows are appended to a scratch file and framed as a .npy on commit.
+    """
+
+    def __init__(self, prefix: str):
+        os.makedirs(os.path.dirname(prefix) or '.', exist_ok=True)
+        self.prefix = prefix
+        self.version = uuid.uuid4().hex[:16]
+        self.count = 0
+        self.dim = 0
+        self._rows = open(f"{prefix}.{self.version}.rows.tmp", 'wb')
+        self._records = open(f"{prefix}.{self.version}.json.tmp", 'w', encoding='utf-8')
+        self._records.write('[')
+
+    def append(self, vectors, records: list):
+        if not len(records):
+            return
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        self.dim = vectors.shape[1]
+        self._rows.write(vectors.tobytes())
+        for record in records:
+            self._records.write((', ' if self.count else '') + json.dumps(record, ensure_ascii=False))
+            self.count += 1
+
+    def commit(self):
+        self._records.write(']')
+        self._records.close()
+        self._rows.close()
+        rows_path = f"{self.prefix}.{self.version}.rows.tmp"
+        with open(f"{self.prefix}.{self.version}.npy.tmp", 'wb') as f, open(rows_path, 'rb') as rows:
+            header = {'descr': np.lib.format.dtype_to_descr(np.dtype(np.float32)), 'fortran_order': False, 'shape': (self.count, self.dim)}
+            np.lib.format.write_array_header_1_0(f, header)
+            shutil.copyfileobj(rows, f, 1 << 20)
+        os.remove(rows_path)
+        _publish(self.prefix, self.version)
+
+    def abort(self):
+        self._records.close()
+        self._rows.close()
+        for ext in ('rows', 'json', 'npy'):
+            path = f"{self.prefix}.{self.version}.{ext}.tmp"
+            if os.path.exists(path):
+                os.remove(path)
+
+def top_k(vectors, query_vector, k: int):
+    """ Indices and scores of the k best rows by dot product, best first. """
+    if len(vectors) == 0:
+        return np.array([], dtype=int), np.array([], dtype=np.float32)
+    scores = vectors @ query_vector
+    k = min(k, len(scores))
+    idx = np.argpartition(-scores, k - 1)[:k]
+    idx = idx[np.argsort(-scores[idx])]
+    return idx, scores[idx]
+
+def _load_manifest(index_dir: str) -> dict:
+    path = os.path.join(index_dir, MANIFEST_NAME)
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+def _save_manifest(index_dir: str, manifest: dict):
+    os.makedirs(index_dir, exist_ok=True)
+    path = os.path.join(index_dir, MANIFEST_NAME)
+    with open(f"{path}.tmp", 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(f"{path}.tmp", path)
+
+
+class DocumentIndex:
+    """ Read-only index over one or more memory-mapped chunk matrices, with BM25 over the chunk text. """
+
+    def __init__(self, embedding_model, parts: list):
+        self.embedding_model = embedding_model
+        self.parts = parts  # list of (vectors, records)
+        self.records = [record for _, records in parts for record in records]
+        self.lexical = BM25([record['page_content'] for record in self.records])
+
+    def __len__(self):
+        return len(self.records)
+
+    def _dense(self, embedding, k: int) -> list:
+        """ (score, position in self.records) of the k best chunks, best first. """
+        query_vector = normalize_rows(embedding)[0]
+        candidates = []
+        offset = 0
+        for vectors, records in self.parts:
+            idx, scores = top_k(vectors, query_vector, k)
+            candidates += [(float(score), offset + int(i)) for i, score in zip(idx, scores)]
+            offset += len(records)
+        candidates.sort(key=lambda item: item[0], reverse=True)
+        return candidates[:k]
+
+    def _documents(self, positions) -> list:
+        return [
+            Document(page_content=self.records[i]['page_content'], metadata=self.records[i]['metadata'])
+            for i in positions
+        ]
+
+    def similarity_search_by_vector(self, embedding, k: int = 4):
+        return self._documents(i for _, i in self._dense(embedding, k))
+
+    def similarity_search(self, query: str, k: int = 4):
+        return self.similarity_search_by_vector(self.embedding_model.embed_query(query), k=k)
+
+    def hybrid_search(self, query: str, k: int = 4, candidates: int = 20):
+        """
+            BM25 and dense retrieval fused with reciprocal-rank fusion. A query whose best BM25
+            hit is unambiguous (e.g. a product name) is answered from BM25 alone, without embedding it.
+        """
+        lexical_hits = self.lexical.search(query, candidates)
+        if lexical_confident(self.lexical, query, lexical_hits):
+            return self._documents(i for i, _ in lexical_hits[:k])
+        dense_hits = self._dense(self.embedding_model.embed_query(query), candidates)
+        fused = reciprocal_rank_fusion([[i for _, i in dense_hits], [i for i, _ in lexical_hits]])
+        return self._documents(i for i, _ in fused[:k])
+
+
+def build_document(file_path, load_documents, text_splitter, embedding_model) -> tuple:
+    docs = load_documents(file_path)
+    splits = text_splitter.split_documents(docs)
+    vectors = normalize_rows(embedding_model.embed_documents([doc.page_content for doc in splits])) if splits else np.zeros((0, 0), dtype=np.float32)
+    records = [{'page_content': doc.page_content, 'metadata': doc.metadata} for doc in splits]
+    return vectors, records
+
+def _document_key(file_path, entry: dict, chunk_size: int, chunk_overlap: int, model_name: str) -> tuple:
+    stat = os.stat(file_path)
+    # skip hashing when size and mtime are unchanged
+    if entry.get('size') == stat.st_size and entry.get('mtime_ns') == stat.st_mtime_ns:
+        doc_hash = entry['sha256']
+    else:
+        doc_hash = file_sha256(file_path)
+    new_entry = {'sha256': doc_hash, 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns,
+                 'key': index_key(doc_hash, chunk_size, chunk_overlap, model_name)}
+    return new_entry['key'], new_entry
+
+def _drop_stale(index_dir: str, entry: dict, key: str):
+    # drop the matrix of a previous version of this document
+    old_key = entry.get('key')
+    if old_key and old_key != key:
+        remove_matrix(os.path.join(index_dir, old_key))
+
+def manifest_version(index_dir: str = INDEX_DIR):
+    path = os.path.join(index_dir, MANIFEST_NAME)
+    return os.stat(path).st_mtime_ns if os.path.exists(path) else None
+
+def indexed_files(index_dir: str = INDEX_DIR) -> list:
+    """ Documents recorded in the manifest that still exist on disk. """
+    return [path for path in _load_manifest(index_dir) if os.path.exists(path)]
+
+def is_indexed(file_path, chunk_size: int, chunk_overlap: int, model_name: str, index_dir: str = INDEX_DIR) -> bool:
+    file_path = os.path.normpath(file_path)
+    key, _ = _document_key(file_path, _load_manifest(index_dir).get(file_path, {}), chunk_size, chunk_overlap, model_name)
+    return load_matrix(os.path.join(index_dir, key)) is not None
+
+class DocumentWriter:
+    """
+        Streams the chunks of one document embedded elsewhere (e.g. by ingest_service.py) into the
+        index batch by batch; commit() publishes the matrix and records the document in the manifest.
+    """
+
+    def __init__(self, file_path, chunk_size: int, chunk_overlap: int, model_name: str, index_dir: str = INDEX_DIR):
+        self.file_path = os.path.normpath(file_path)
+        self.index_dir = index_dir
+        self.entry = _load_manifest(index_dir).get(self.file_path, {})
+        self.key, self.new_entry = _document_key(self.file_path, self.entry, chunk_size, chunk_overlap, model_name)
+        self.writer = MatrixWriter(os.path.join(index_dir, self.key))
+
+    def append(self, vectors, records: list):
+        if len(records):
+            self.writer.append(normalize_rows(vectors), records)
+
+    def commit(self) -> int:
+        self.writer.commit()
+        _drop_stale(self.index_dir, self.entry, self.key)
+        manifest = _load_manifest(self.index_dir)
+        manifest[self.file_path] = self.new_entry
+        _save_manifest(self.index_dir, manifest)
+        return self.writer.count
+
+    def abort(self):
+        self.writer.abort()
+
+def store_document(file_path, vectors, records: list, chunk_size: int, chunk_overlap: int, model_name: str, index_dir: str = INDEX_DIR):
+    """ Writes the chunks of one document embedded elsewhere in one go and records it in the manifest. """
+    writer = DocumentWriter(file_path, chunk_size, chunk_overlap, model_name, index_dir)
+    writer.append(vectors, records)
+    return writer.commit()
+
+def load_or_build_index(file_paths, load_documents, text_splitter, embedding_model, model_name: str, index_dir: str = INDEX_DIR):
+    """
+        Loads the on-disk index for every file, embedding only the files whose content changed.
+
+        Args:
+        file_paths = documents to index
+        load_documents = callable returning a list of Documents for a file path
+        text_splitter = splitter with `_chunk_size`, `_chunk_overlap` and `split_documents`
+        embedding_model = model used to embed new or changed documents and queries
+        model_name = embedding model name, part of the cache key
+        index_dir = directory holding the `.npy`/`.json` pairs, their pointers and the manifest
+
+        Return:
+        DocumentIndex over memory-mapped vectors
+    """
+    manifest = _load_manifest(index_dir)
+    chunk_size, chunk_overlap = text_splitter._chunk_size, text_splitter._chunk_overlap
+    parts = []
+    changed = False
+
+    for file_path in dict.fromkeys(os.path.normpath(path) for path in file_paths):
+        entry = manifest.get(file_path, {})
+        key, new_entry = _document_key(file_path, entry, chunk_size, chunk_overlap, model_name)
+        prefix = os.path.join(index_dir, key)
+        loaded = load_matrix(prefix)
+        if loaded is None:
+            vectors, records = build_document(file_path, load_documents, text_splitter, embedding_model)
+            save_matrix(prefix, vectors, records)
+            loaded = load_matrix(prefix)
+        _drop_stale(index_dir, entry, key)
+
+        if new_entry != entry:
+            manifest[file_path] = new_entry
+            changed = True
+        parts.append(loaded)
+
+    if changed:
+        _save_manifest(index_dir, manifest)
+    return DocumentIndex(embedding_model, parts)
@@ -0,0 +1,108 @@
+import heapq
+import math
+import os
+import re
+from collections import Counter, defaultdict
+
+# the best BM25 hit must beat the runner-up by this factor to skip the embedding call
+LEXICAL_MARGIN = float(os.environ.get('LEXICAL_MARGIN', '1.5'))
+RRF_K = 60
+
+# frequent Indonesian and English words that carry no meaning for matching
+STOPWORDS = {
+    "yang", "dan", "di", "ke", "dari", "untuk", "dengan", "pada", "ini", "itu", "atau", "adalah", "apa",
+    "apakah", "bagaimana", "siapa", "kapan", "dimana", "mengapa", "saja", "juga", "dalam", "oleh", "sebagai",
+    "the", "a", "an", "of", "to", "in", "is", "are", "and", "or", "for", "on", "what", "how", "who", "does", "do",
+}
+
+def tokenize(text: str) -> list:
+    return [token for token in re.findall(r"\w+", text.casefold()) if token not in STOPWORDS]
+
+
+class BM25:
+    """ Okapi BM25 over a fixed list of texts, backed by an inverted index of term -> [(doc, tf)]. """
+
+    def __init__(self, texts: list, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.postings = defaultdict(list)
+        self.lengths = []
+        for i, text in enumerate(texts):
+            terms = Counter(tokenize(text))
+            for term, tf in terms.items():
+                self.postings[term].append((i, tf))
+            self.lengths.append(sum(terms.values()))
+        self.avg_length = (sum(self.lengths) / len(self.lengths)) if self.lengths else 0.0
+        n = len(self.lengths)
+        self.idf = {term: math.log(1 + (n - len(docs) + 0.5) / (len(docs) + 0.5)) for term, docs in self.postings.items()}
+
+    def __len__(self):
+        return len(self.lengths)
+
+    def _scores(self, terms: list) -> dict:
+        scores = defaultdict(float)
+        for term in terms:
+            # only documents containing the term are touched
+            for i, tf in self.postings.get(term, ()):
+                norm = self.k1 * (1 - self.b + self.b * self.lengths[i] / (self.avg_length or 1))
+                scores[i] += self.idf[term] * tf * (self.k1 + 1) / (tf + norm)
+        return scores
+
+    def score(self, query: str) -> list:
+        scores = self._scores(tokenize(query))
+        return [scores.get(i, 0.0) for i in range(len(self.lengths))]
+
+    def search(self, query: str, k: int) -> list:
+        """ (document index, score) of the k best matching texts, best first. """
+        scores = self._scores(tokenize(query))
+        return heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+
+    def covers(self, query: str, i: int) -> bool:
+        """ True when document i contains every term of the query. """
+        terms = set(tokenize(query))
+        return bool(terms) and all(any(doc == i for doc, _ in self.postings.get(term, ())) for term in terms)
+
+
+def reciprocal_rank_fusion(rankings: list, k: int = RRF_K) -> list:
+    """ Fuses several rankings of ids, best first, into one list of (id, score) by reciprocal-rank fusion. """
+    fused = defaultdict(float)
+    for ranking in rankings:
+        for rank, item in enumerate(ranking):
+            fused[item] += 1.0 / (k + rank + 1)
+    return sorted(fused.items(), key=lambda item: item[1], reverse=True)
+
+def lexical_confident(index: BM25, query: str, hits: list, margin: float = LEXICAL_MARGIN) -> bool:
+    """
+        True when BM25 alone is trustworthy for the query: the best hit contains every query term
+        and scores at least `margin` times the runner-up. Such queries skip the embedding call.
+    """
+    if not hits:
+        return False
+    if len(hits) > 1 and hits[0][1] < margin * hits[1][1]:
+        return False
+    return index.covers(query, hits[0][0])
+
+
+def rerank(query: str, candidates: list, text, top_n: int, alpha: float = 0.6) -> list:
+    """
+        Re-orders dense retrieval candidates with a hybrid of their dense rank and BM25.
+
+        Args:
+        query = user query
+        candidates = hits in dense order, best first
+        text = callable returning the text of a candidate
+        top_n = number of candidates to keep
+        alpha = weight of the dense rank, 1 - alpha goes to BM25
+
+        Return:
+        the best top_n candidates
+    """
+    if len(candidates) <= 1:
+        return candidates[:top_n]
+    # rank-based dense score works for any Milvus metric (COSINE, IP or L2)
+    dense = [1 - rank / len(candidates) for rank in range(len(candidates))]
+    lexical = BM25([text(candidate) for candidate in candidates]).score(query)
+    best_lexical = max(lexical) or 1.0
+    combined = [alpha * d + (1 - alpha) * l / best_lexical for d, l in zip(dense, lexical)]
+    order = sorted(range(len(candidates)), key=lambda i: combined[i], reverse=True)
+    return [candidates[i] for i in order[:top_n]]
@@ -0,0 +1,235 @@
+import asyncio
+import os
+import random
+import threading
+import time
+import weakref
+from functools import lru_cache
+
+import httpx
+
+from agents.telemetry import LLM_RETRIES
+from dotenv import load_dotenv
+load_dotenv()
+
+OPENAI_API_KEY = os.environ.get('OPENAI_API_KEY')
+DEFAULT_CHAT_MODEL = os.environ.get('GPT_MODEL') or "gpt-4.1-mini"
+# connections kept open to the API and reused across every agent
+LLM_MAX_CONNECTIONS = int(os.environ.get('LLM_MAX_CONNECTIONS', '64'))
+LLM_MAX_KEEPALIVE = int(os.environ.get('LLM_MAX_KEEPALIVE', '32'))
+# requests in flight at once per process, waiting callers queue on a semaphore
+LLM_CONCURRENCY = int(os.environ.get('LLM_CONCURRENCY', '16'))
+LLM_MAX_RETRIES = int(os.environ.get('LLM_MAX_RETRIES', '4'))
+LLM_TIMEOUT = float(os.environ.get('LLM_TIMEOUT', '60'))
+RETRY_STATUSES = {408, 409, 429, 500, 502, 503, 504}
+
+
+# Supporting functions
+def retry_delay(response, attempt: int, base: float = 0.5, cap: float = 30.0) -> float:
+    # prefer the server's Retry-After, otherwise exponential backoff with full jitter
+    retry_after = response.headers.get('retry-after') if response is not None else None
+    if retry_after:
+        try:
+            return float(retry_after)
+        except ValueError:
+            pass
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+def _limits():
+    return httpx.Limits(max_connections=LLM_MAX_CONNECTIONS, max_keepalive_connections=LLM_MAX_KEEPALIVE)
+
+
+class _ReleasingStream(httpx.SyncByteStream):
+    """ Holds a concurrency slot until a (possibly streamed) response body is closed. """
+
+    def __init__(self, stream, release):
+        self._stream = stream
+        self._release = release
+
+    def __iter__(self):
+        yield from self._stream
+
+    def close(self):
+        try:
+            self._stream.close()
+        finally:
+            self._release()
+
+
+class _AsyncReleasingStream(httpx.AsyncByteStream):
+    def __init__(self, stream, release):
+        self._stream = stream
+        self._release = release
+
+    async def __aiter__(self):
+        async for chunk in self._stream:
+            yield chunk
+
+    async def aclose(self):
+        try:
+            await self._stream.aclose()
+        finally:
+            self._release()
+
+
+class RetryTransport(httpx.HTTPTransport):
+    """
+        Pooled transport that bounds concurrent requests with a semaphore and retries rate limits,
+        server errors and connection failures with jittered backoff.
+    """
+
+    def __init__(self, concurrency: int = LLM_CONCURRENCY, max_retries: int = LLM_MAX_RETRIES, **kwargs):
+        super().__init__(limits=_limits(), **kwargs)
+        self._semaphore = threading.BoundedSemaphore(concurrency)
+        self.max_retries = max_retries
+
+    def handle_request(self, request):
+        self._semaphore.acquire()
+        released = threading.Event()
+
+        def release():
+            if not released.is_set():
+                released.set()
+                self._semaphore.release()
+
+        try:
+            for attempt in range(self.max_retries + 1):
+                try:
+                    response = super().handle_request(request)
+                except (httpx.ConnectError, httpx.ConnectTimeout):
+                    if attempt == self.max_retries:
+                        raise
+                    LLM_RETRIES.inc(reason="connect")
+                    time.sleep(retry_delay(None, attempt))
+                    continue
+                if response.status_code in RETRY_STATUSES and attempt < self.max_retries:
+                    response.close()
+                    LLM_RETRIES.inc(reason=str(response.status_code))
+                    time.sleep(retry_delay(response, attempt))
+                    continue
+                response.stream = _ReleasingStream(response.stream, release)
+                return response
+        except BaseException:
+            release()
+            raise
+
+
+class AsyncRetryTransport(httpx.AsyncBaseTransport):
+    """
+        Async counterpart of RetryTransport for `ainvoke`/`astream`. Connection pools and semaphores
+        are bound to the event loop that created them, so each running loop gets its own pair and
+        one client keeps working across `asyncio.run` calls.
+    """
+
+    def __init__(self, concurrency: int = LLM_CONCURRENCY, max_retries: int = LLM_MAX_RETRIES, **kwargs):
+        self._concurrency = concurrency
+        self._transport_kwargs = kwargs
+        self._pools = weakref.WeakKeyDictionary()  # loop -> (AsyncHTTPTransport, Semaphore)
+        self.max_retries = max_retries
+
+    def _pool(self):
+        loop = asyncio.get_running_loop()
+        if loop not in self._pools:
+            self._pools[loop] = (httpx.AsyncHTTPTransport(limits=_limits(), **self._transport_kwargs), asyncio.Semaphore(self._concurrency))
+        return self._pools[loop]
+
+    async def handle_async_request(self, request):
+        transport, semaphore = self._pool()
+        await semaphore.acquire()
+        released = False
+
+        def release():
+            nonlocal released
+            if not released:
+                released = True
+                semaphore.release()
+
+        try:
+            for attempt in range(self.max_retries + 1):
+                try:
+                    response = await transport.handle_async_request(request)
+                except (httpx.ConnectError, httpx.ConnectTimeout):
+                    if attempt == self.max_retries:
+                        raise
+                    LLM_RETRIES.inc(reason="connect")
+                    await asyncio.sleep(retry_delay(None, attempt))
+                    continue
+                if response.status_code in RETRY_STATUSES and attempt < self.max_retries:
+                    await response.aclose()
+                    LLM_RETRIES.inc(reason=str(response.status_code))
+                    await asyncio.sleep(retry_delay(response, attempt))
+                    continue
+                response.stream = _AsyncReleasingStream(response.stream, release)
+                return response
+        except BaseException:
+            release()
+            raise
+
+    async def aclose(self):
+        # pools of other loops cannot be closed from this one, they go with their loop
+        pool = self._pools.pop(asyncio.get_running_loop(), None)
+        if pool is not None:
+            await pool[0].aclose()
+
+
+# Shared clients, created on first use
+@lru_cache(maxsize=None)
+def get_http_client() -> httpx.Client:
+    return httpx.Client(transport=RetryTransport(), timeout=LLM_TIMEOUT)
+
+@lru_cache(maxsize=None)
+def get_async_http_client() -> httpx.AsyncClient:
+    return httpx.AsyncClient(transport=AsyncRetryTransport(), timeout=LLM_TIMEOUT)
+
+# model factories installed by use_models(), e.g. the offline fakes of benchmark.py
+_factories = {}
+
+def use_models(chat=None, embeddings=None):
+    """
+        Replaces the models every agent gets from this module. Call it before the agents build
+        their models; calling it without arguments restores the OpenAI and HuggingFace models.
+
+        Args:
+        chat = callable(model, **kwargs) returning a chat model
+        embeddings = callable(model) returning an embeddings model, used for OpenAI and local models
+    """
+    _factories.clear()
+    if chat is not None:
+        _factories['chat'] = chat
+    if embeddings is not None:
+        _factories['embeddings'] = embeddings
+    get_chat_model.cache_clear()
+    get_embeddings_model.cache_clear()
+    get_local_embeddings_model.cache_clear()
+
+@lru_cache(maxsize=None)
+def get_chat_model(model: str = DEFAULT_CHAT_MODEL, **kwargs):
+    """
+        Returns one ChatOpenAI per set of parameters, all sharing the pooled HTTP clients.
+        Retries happen in the transport, so the OpenAI SDK's own retries are turned off.
+
+        Args:
+        model = OpenAI model name
+        kwargs = extra ChatOpenAI parameters, e.g. temperature=0 (must be hashable)
+    """
+    if 'chat' in _factories:
+        return _factories['chat'](model, **kwargs)
+    from langchain_openai import ChatOpenAI
+    return ChatOpenAI(model=model, api_key=OPENAI_API_KEY, http_client=get_http_client(),
+                      http_async_client=get_async_http_client(), max_retries=0, **kwargs)
+
+@lru_cache(maxsize=None)
+def get_embeddings_model(model: str = "text-embedding-ada-002"):
+    if 'embeddings' in _factories:
+        return _factories['embeddings'](model)
+    from langchain_openai import OpenAIEmbeddings
+    return OpenAIEmbeddings(model=model, openai_api_key=OPENAI_API_KEY, http_client=get_http_client(),
+                            http_async_client=get_async_http_client(), max_retries=0)
+
+@lru_cache(maxsize=None)
+def get_local_embeddings_model(model: str):
+    # sentence-transformers model running in-process, used by the RAG document index
+    if 'embeddings' in _factories:
+        return _factories['embeddings'](model)
+    from langchain_huggingface import HuggingFaceEmbeddings
+    return HuggingFaceEmbeddings(model_name=model)
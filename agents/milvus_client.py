@@ -0,0 +1,129 @@
+import asyncio
+import os
+import threading
+import time
+import weakref
+
+from pymilvus import MilvusClient
+
+# A Milvus Lite file path (e.g. ./milvus.db) works as well as a server URI
+MILVUS_URI = os.environ.get('MILVUS_URI', 'http://192.168.76.22:19531')
+MILVUS_DB = os.environ.get('MILVUS_DB', 'digicamp_ai_miniproject')
+MILVUS_COLLECTION = os.environ.get('MILVUS_COLLECTION', 'Allen_IU_MiniProject')
+HEALTH_CHECK_INTERVAL = float(os.environ.get('MILVUS_HEALTH_CHECK_INTERVAL', '30'))
+
+_client = None
+_last_check = 0.0
+_lock = threading.Lock()
+# AsyncMilvusClient per event loop, its gRPC channel cannot be shared between loops
+_async_clients = weakref.WeakKeyDictionary()
+
+
+# Supporting functions
+def _is_server_uri(uri: str) -> bool:
+    return uri.startswith(('http://', 'https://', 'tcp://', 'grpc://'))
+
+def _connect_kwargs() -> dict:
+    kwargs = {"uri": MILVUS_URI}
+    # Milvus Lite has a single implicit database
+    if MILVUS_DB and _is_server_uri(MILVUS_URI):
+        kwargs["db_name"] = MILVUS_DB
+    return kwargs
+
+def _connect():
+    return MilvusClient(**_connect_kwargs())
+
+def supports_async() -> bool:
+    # Milvus Lite has no async client
+    return _is_server_uri(MILVUS_URI)
+
+def _is_healthy(client) -> bool:
+    try:
+        client.list_collections()
+        return True
+    except Exception:
+        return False
+
+def get_client():
+    """
+        Returns the process-wide MilvusClient, connecting on first use. The connection is
+        health-checked at most every HEALTH_CHECK_INTERVAL seconds and replaced when it fails.
+    """
+    global _client, _last_check
+    with _lock:
+        now = time.monotonic()
+        if _client is not None and now - _last_check < HEALTH_CHECK_INTERVAL:
+            return _client
+        if _client is None or not _is_healthy(_client):
+            _close(_client)
+            _client = _connect()
+        _last_check = now
+        return _client
+
+def reconnect():
+    global _client, _last_check
+    with _lock:
+        _close(_client)
+        _client = _connect()
+        _last_check = time.monotonic()
+        return _client
+
+def set_client(client):
+    """ Replaces the shared client, e.g. with a Milvus Lite client or a stand-in exposing search and list_collections. """
+    global _client, _last_check
+    with _lock:
+        _client = client
+        _last_check = time.monotonic() if client is not None else 0.0
+
+def _close(client):
+    if client is None:
+        return
+    try:
+        client.close()
+    except Exception:
+        pass
+
+def call_with_retry(fn):
+    """ Runs fn(client) and retries once on a fresh connection if the first attempt failed because the connection is broken. """
+    client = get_client()
+    try:
+        return fn(client)
+    except Exception:
+        if _is_healthy(client):
+            raise
+        return fn(reconnect())
+
+def get_async_client():
+    """ Returns the AsyncMilvusClient of the running event loop, connecting on first use. Server URIs only. """
+    from pymilvus import AsyncMilvusClient
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        client = _async_clients[loop] = AsyncMilvusClient(**_connect_kwargs())
+    return client
+
+async def _ais_healthy(client) -> bool:
+    try:
+        await client.list_collections()
+        return True
+    except Exception:
+        return False
+
+async def acall_with_retry(fn):
+    """
+        Async counterpart of call_with_retry: awaits fn(client) and retries once on a fresh connection
+        if the first attempt failed because the connection is broken. Other errors (a bad filter, a
+        missing collection) are raised as they are.
+    """
+    client = get_async_client()
+    try:
+        return await fn(client)
+    except Exception:
+        if await _ais_healthy(client):
+            raise
+        _async_clients.pop(asyncio.get_running_loop(), None)
+        try:
+            await client.close()
+        except Exception:
+            pass
+        return await fn(get_async_client())
@@ -0,0 +1,50 @@
+import os
+import re
+
+from agents.cache import LRUCache
+from agents.sqlite_pool import get_pool
+
+QUERY_CACHE_TTL = float(os.environ.get('QUERY_CACHE_TTL', '3600'))
+QUERY_CACHE_MAX_BYTES = int(os.environ.get('QUERY_CACHE_MAX_BYTES', str(8 * 1024 * 1024)))
+QUESTION_CACHE_TTL = float(os.environ.get('QUESTION_CACHE_TTL', '86400'))
+
+# normalized SQL + database version -> rendered query result
+result_cache = LRUCache(max_entries=2048, ttl=QUERY_CACHE_TTL, max_bytes=QUERY_CACHE_MAX_BYTES,
+                        sizeof=lambda value: len(value.encode('utf-8')))
+# normalized question + database -> SQL that was validated and answered it
+question_cache = LRUCache(max_entries=2048, ttl=QUESTION_CACHE_TTL)
+
+_QUOTED = re.compile(r"('(?:[^']|'')*'|\"(?:[^\"]|\"\")*\")")
+
+
+# Supporting functions
+def normalize_sql(query: str) -> str:
+    """ Collapses whitespace and case outside of quoted literals, drops the trailing semicolon. """
+    parts = _QUOTED.split(query.strip().rstrip(';'))
+    normalized = []
+    for i, part in enumerate(parts):
+        # odd indices are the quoted literals captured by the split
+        normalized.append(part if i % 2 else re.sub(r"\s+", " ", part).lower())
+    return "".join(normalized).strip()
+
+def normalize_question(question: str) -> str:
+    question = re.sub(r"[^\w\s]", " ", question.casefold())
+    return re.sub(r"\s+", " ", question).strip()
+
+def database_version(db_name: str) -> tuple:
+    """ Identity and version of a database file; changes whenever the data is modified. """
+    pool = get_pool(db_name)
+    return (pool.db_path, os.stat(pool.db_path).st_mtime_ns, pool.data_version())
+
+def result_key(query: str, db_name: str) -> tuple:
+    # take the key before running the query so a concurrent write can only make the entry unreachable
+    return (normalize_sql(query), database_version(db_name))
+
+def get_sql(question: str, db_name: str):
+    return question_cache.get((normalize_question(question), get_pool(db_name).db_path))
+
+def set_sql(question: str, db_name: str, query: str):
+    question_cache.set((normalize_question(question), get_pool(db_name).db_path), query)
+
+def stats() -> dict:
+    return {"results": result_cache.stats(), "questions": question_cache.stats()}
@@ -0,0 +1,44 @@
+import importlib
+import threading
+
+# agent name -> module exposing build_graph()
+AGENT_MODULES = {
+    "simple": "agents.graph",
+    "RAG": "agents.RAG",
+    "DBQNA": "agents.DBQNA",
+    "DOCSQNA": "agents.DOCSQNA",
+}
+
+_graphs = {}
+_lock = threading.Lock()
+
+def get_graph(name: str):
+    """
+        Returns the compiled graph of an agent, importing and building it on first use.
+        Graphs are cached per process, so later calls are a dictionary lookup.
+
+        Args:
+        name = agent name, one of AGENT_MODULES
+
+        Return:
+        compiled graph
+    """
+    graph = _graphs.get(name)
+    if graph is not None:
+        return graph
+
+    if name not in AGENT_MODULES:
+        raise KeyError(f"Unknown agent '{name}'. Available agents: {', '.join(AGENT_MODULES)}")
+
+    with _lock:
+        if name not in _graphs:
+            module = importlib.import_module(AGENT_MODULES[name])
+            _graphs[name] = module.build_graph()
+        return _graphs[name]
+
+def is_built(name: str) -> bool:
+    return name in _graphs
+
+def clear():
+    with _lock:
+        _graphs.clear()
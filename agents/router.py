@@ -0,0 +1,210 @@
+import logging
+import os
+import re
+import threading
+from collections import Counter
+
+import numpy as np
+
+from agents.index_store import normalize_rows
+
+logger = logging.getLogger(__name__)
+
+# share of keyword hits the best agent needs before the rules decide alone
+ROUTER_RULE_CONFIDENCE = float(os.environ.get('ROUTER_RULE_CONFIDENCE', '0.75'))
+# the nearest centroid must be this similar and beat the runner-up by this margin
+ROUTER_MIN_SIMILARITY = float(os.environ.get('ROUTER_MIN_SIMILARITY', '0.75'))
+ROUTER_MIN_MARGIN = float(os.environ.get('ROUTER_MIN_MARGIN', '0.03'))
+# keyword hits the rules need to decide without a domain-specific term
+ROUTER_MIN_RULE_HITS = int(os.environ.get('ROUTER_MIN_RULE_HITS', '2'))
+
+# DBQNA answers from the Chinook music store database, RAG from the company profile, DOCSQNA from the FAQ
+# domain-specific terms, one of them is enough for the rules to decide
+ROUTE_RULES = {
+    "DBQNA": [
+        r"\b(tracks?|albums?|artists?|genres?|playlists?|invoices?|media types?)\b",
+        r"\b(lagu|penyanyi|karyawan toko|faktur)\b",
+        r"\b(database|tabel|table|sql|query)\b",
+    ],
+    "RAG": [
+        r"\b(sejarah|history|didirikan|founded|pendiri|founder|soetikno|palembang|1969)\b",
+        r"\b(profil perusahaan|company profile|gambaran umum|overview|nilai dasar|strive for excellence)\b",
+    ],
+    "DOCSQNA": [
+        r"\b(faq|produk|product|obat|ogb|ogbdexa|omai|dlbs|herbal|vaksin|suplemen|otc|ndds)\b",
+        r"\b(lamar|melamar|lowongan|karir|career|magang|intern|pelatihan|calon karyawan)\b",
+        r"\b(pabrik|karawang|cpob|call center|keluhan|brosur|csr|umkm|kerja sama|mitra|media sosial)\b",
+    ],
+}
+
+# generic words that count towards an agent but cannot decide alone, e.g. Dexa Medica has employees too
+ROUTE_HINTS = {
+    "DBQNA": [
+        r"\b(customers?|employees?|pelanggan|tagihan|penjualan|pembelian)\b",
+        r"\b(how many|berapa banyak|total|rata-rata|average|top \d+|paling banyak|terbanyak)\b",
+    ],
+}
+
+# a question matching these is never ruled to the agent, the Chinook store knows nothing about Dexa Medica
+ROUTE_VETOES = {
+    "DBQNA": r"\b(dexa|perusahaan|company|farmasi|pharma\w*|obat)\b",
+}
+
+# seed questions for the nearest-centroid classifier, DOCSQNA also gets the FAQ questions
+ROUTE_EXAMPLES = {
+    "DBQNA": [
+        "Which artist has the most albums?",
+        "How many tracks are in the Rock genre?",
+        "Who are the top 5 customers by total invoice amount?",
+        "Berapa total penjualan per negara?",
+        "Sebutkan 10 lagu terpanjang di database.",
+        "Which employee supports the most customers?",
+    ],
+    "RAG": [
+        "Kapan Dexa Medica didirikan?",
+        "Siapa pendiri Dexa Medica?",
+        "Ceritakan sejarah Dexa Medica.",
+        "Apa visi dan misi Dexa Medica?",
+        "Apa nilai dasar perusahaan Dexa Medica?",
+        "Give me an overview of the Dexa Medica company profile.",
+    ],
+    "DOCSQNA": [
+        "Apa itu OGBdexa?",
+        "Bagaimana cara melamar kerja di Dexa Medica?",
+        "Apakah Dexa Medica memproduksi vaksin?",
+        "Di mana lokasi pabrik Dexa Medica?",
+        "Apakah Dexa Medica memiliki program magang?",
+        "Bagaimana cara menghubungi call center Dexa Medica?",
+    ],
+}
+
+
+# Supporting functions
+def default_embedding_model():
+    # the same cached client as DOCSQNA, so a routed question's embedding is reused by its semantic cache
+    from agents.DOCSQNA import get_embeddings_model
+    return get_embeddings_model()
+
+def faq_questions() -> list:
+    try:
+        from agents.faq_backend import get_lexical_index
+        records, _ = get_lexical_index()
+        return [record['question'] for record in records]
+    except Exception as e:
+        logger.warning("FAQ questions unavailable for routing: %s", e)
+        return []
+
+
+class Router:
+    """
+        Picks the agent for a question without an LLM call when it can: keyword rules first,
+        then the nearest centroid of embedded example questions. Returns no agent when both
+        are unsure, leaving the decision to the LLM supervisor.
+    """
+
+    def __init__(self, embedding_model=None, rules: dict = ROUTE_RULES, examples: dict = ROUTE_EXAMPLES,
+                 rule_confidence: float = ROUTER_RULE_CONFIDENCE, min_similarity: float = ROUTER_MIN_SIMILARITY,
+                 min_margin: float = ROUTER_MIN_MARGIN, hints: dict = ROUTE_HINTS, vetoes: dict = ROUTE_VETOES,
+                 min_rule_hits: int = ROUTER_MIN_RULE_HITS):
+        self.embedding_model = embedding_model
+        self.rules = {agent: [re.compile(pattern, re.IGNORECASE) for pattern in patterns] for agent, patterns in rules.items()}
+        self.hints = {agent: [re.compile(pattern, re.IGNORECASE) for pattern in patterns] for agent, patterns in hints.items()}
+        self.vetoes = {agent: re.compile(pattern, re.IGNORECASE) for agent, pattern in vetoes.items()}
+        self.min_rule_hits = min_rule_hits
+        self.examples = examples
+        self.rule_confidence = rule_confidence
+        self.min_similarity = min_similarity
+        self.min_margin = min_margin
+        self._agents = None
+        self._centroids = None
+        self._lock = threading.Lock()
+        self.decisions = Counter()
+
+    def classify_rules(self, question: str):
+        """
+            (agent, share of keyword hits, decisive) or None when no rule matched. Decisive means the
+            agent has a domain-specific hit or at least min_rule_hits hits, so the rules may decide alone.
+        """
+        def count(patterns):
+            return sum(len(pattern.findall(question)) for pattern in patterns)
+
+        vetoed = {agent for agent, pattern in self.vetoes.items() if pattern.search(question)}
+        agents = (set(self.rules) | set(self.hints)) - vetoed
+        domain = Counter({agent: count(self.rules.get(agent, ())) for agent in agents})
+        hits = Counter({agent: domain[agent] + count(self.hints.get(agent, ())) for agent in agents})
+        total = sum(hits.values())
+        if not total:
+            return None
+        agent, agent_hits = hits.most_common(1)[0]
+        return agent, agent_hits / total, domain[agent] > 0 or agent_hits >= self.min_rule_hits
+
+    def _load_centroids(self):
+        with self._lock:
+            if self._centroids is None:
+                if self.embedding_model is None:
+                    self.embedding_model = default_embedding_model()
+                examples = {agent: list(questions) for agent, questions in self.examples.items()}
+                examples.setdefault("DOCSQNA", []).extend(faq_questions())
+                self._agents = [agent for agent in examples if examples[agent]]
+                centroids = [
+                    normalize_rows(self.embedding_model.embed_documents(examples[agent])).mean(axis=0)
+                    for agent in self._agents
+                ]
+                self._centroids = normalize_rows(np.stack(centroids))
+        return self._agents, self._centroids
+
+    def classify_embedding(self, question: str):
+        """ (agent, similarity, margin over the runner-up) of the nearest centroid. """
+        agents, centroids = self._load_centroids()
+        scores = centroids @ normalize_rows(self.embedding_model.embed_query(question))[0]
+        order = np.argsort(-scores)
+        margin = float(scores[order[0]] - scores[order[1]]) if len(order) > 1 else float(scores[order[0]])
+        return agents[order[0]], float(scores[order[0]]), margin
+
+    def route(self, question: str, fallback=None):
+        """
+            Args:
+            question = user question
+            fallback = optional callable(question) -> agent name, called when the local stages are unsure
+
+            Return:
+            (agent or None, confidence, method) where method is 'rules', 'embedding', 'llm' or 'none'
+        """
+        decision = self._route_locally(question)
+        if decision[0] is None and fallback is not None:
+            decision = (fallback(question), decision[1], "llm")
+        agent, confidence, method = decision
+        with self._lock:
+            self.decisions[method] += 1
+        logger.info("route %r -> %s (method=%s, confidence=%.3f)", question[:80], agent, method, confidence)
+        return decision
+
+    def _route_locally(self, question: str):
+        ruled = self.classify_rules(question)
+        if ruled is not None and ruled[1] >= self.rule_confidence and ruled[2]:
+            return ruled[0], ruled[1], "rules"
+
+        try:
+            agent, similarity, margin = self.classify_embedding(question)
+        except Exception as e:
+            logger.warning("embedding router unavailable: %s", e)
+            return None, ruled[1] if ruled else 0.0, "none"
+        if similarity >= self.min_similarity and margin >= self.min_margin:
+            return agent, margin, "embedding"
+        logger.debug("embedding router unsure: %s similarity=%.3f margin=%.3f", agent, similarity, margin)
+        return None, margin, "none"
+
+    def stats(self) -> dict:
+        total = sum(self.decisions.values())
+        return {"decisions": dict(self.decisions), "local_rate": (total - self.decisions["llm"] - self.decisions["none"]) / total if total else 0.0}
+
+
+_router = None
+_router_lock = threading.Lock()
+
+def get_router() -> Router:
+    global _router
+    with _router_lock:
+        if _router is None:
+            _router = Router()
+        return _router
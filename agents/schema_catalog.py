@@ -0,0 +1,113 @@
+import os
+import threading
+
+from agents.sqlite_pool import get_pool
+
+
+class SchemaCatalog:
+    """ Columns, foreign keys and indexes of every table in one database, captured at one schema version. """
+
+    def __init__(self, db_path: str, version: tuple, tables: dict):
+        self.db_path = db_path
+        self.version = version
+        self.tables = tables
+        # SQLite resolves table names case-insensitively, and so does the catalog
+        self._names = {name.lower(): name for name in tables}
+
+    def table_names(self) -> list:
+        return list(self.tables)
+
+    def render_table(self, table: str) -> str:
+        name = self._names.get(table.strip().lower())
+        if name is None:
+            return f"Table name: {table}\n\tTable is not found. Try a different name.\n\n"
+        info, table = self.tables[name], name
+
+        lines = [f"Table name: {table}", "\tcid | name | type | notnull | dflt_value | pk"]
+        for column in info["columns"]:
+            notnull = "True" if column["notnull"] else "False"
+            pk = "Primary Key" if column["pk"] else "Not PK"
+            lines.append(f"\t{column['cid']} | {column['name']} | {column['type']} | {notnull} | {column['default']} | {pk}")
+        for fk in info["foreign_keys"]:
+            lines.append(f"\tForeign key: {fk['from']} -> {fk['table']}.{fk['to']}")
+        for index in info["indexes"]:
+            unique = "unique " if index["unique"] else ""
+            lines.append(f"\tIndex: {index['name']} ({unique}{', '.join(index['columns'])})")
+        return "\n".join(lines) + "\n\n"
+
+    def render(self, table_list=None) -> str:
+        if table_list is None:
+            table_list = [name for name in self.tables if not name.startswith("sqlite_")]
+        return "".join(self.render_table(table) for table in table_list)
+
+
+# Supporting functions
+def _schema_version(connection) -> int:
+    return connection.execute("PRAGMA schema_version;").fetchone()[0]
+
+def _current_version(db_path: str, connection) -> tuple:
+    return (os.stat(db_path).st_mtime_ns, _schema_version(connection))
+
+def _introspect(connection) -> dict:
+    tables = {}
+    table_names = [row[0] for row in connection.execute("SELECT name FROM sqlite_master WHERE type='table';")]
+    for table in table_names:
+        quoted = '"' + table.replace('"', '""') + '"'
+        columns = [
+            {"cid": row[0], "name": row[1], "type": row[2], "notnull": row[3] == 1, "default": row[4], "pk": row[5] >= 1}
+            for row in connection.execute(f"PRAGMA table_info({quoted});")
+        ]
+        foreign_keys = [
+            {"from": row[3], "table": row[2], "to": row[4]}
+            for row in connection.execute(f"PRAGMA foreign_key_list({quoted});")
+        ]
+        indexes = []
+        for row in connection.execute(f"PRAGMA index_list({quoted});").fetchall():
+            index_name, unique = row[1], row[2] == 1
+            index_quoted = '"' + index_name.replace('"', '""') + '"'
+            index_columns = [col[2] for col in connection.execute(f"PRAGMA index_info({index_quoted});")]
+            indexes.append({"name": index_name, "unique": unique, "columns": index_columns})
+        tables[table] = {"columns": columns, "foreign_keys": foreign_keys, "indexes": indexes}
+    return tables
+
+
+_catalogs = {}
+_lock = threading.Lock()
+
+def get_catalog(db_path: str) -> SchemaCatalog:
+    """
+        Returns the schema catalog of a database, introspecting it only when the file mtime
+        or PRAGMA schema_version differs from the cached copy.
+    """
+    pool = get_pool(db_path)
+    with pool.connection() as connection:
+        version = _current_version(pool.db_path, connection)
+        catalog = _catalogs.get(pool.db_path)
+        if catalog is not None and catalog.version == version:
+            return catalog
+
+        with _lock:
+            catalog = SchemaCatalog(pool.db_path, version, _introspect(connection))
+            _catalogs[pool.db_path] = catalog
+    return catalog
+
+def is_warm(db_path) -> bool:
+    """ True when a catalog for the database is cached and still matches the file. """
+    if not db_path:
+        return False
+    pool = get_pool(db_path)
+    catalog = _catalogs.get(pool.db_path)
+    if catalog is None:
+        return False
+    try:
+        with pool.connection() as connection:
+            return catalog.version == _current_version(pool.db_path, connection)
+    except Exception:
+        return False
+
+def invalidate(db_path=None):
+    with _lock:
+        if db_path is None:
+            _catalogs.clear()
+        else:
+            _catalogs.pop(get_pool(db_path).db_path, None)
@@ -0,0 +1,144 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from agents.embedding_cache import normalize_text
+from agents.index_store import normalize_rows
+
+SEMANTIC_CACHE_THRESHOLD = float(os.environ.get('SEMANTIC_CACHE_THRESHOLD', '0.95'))
+SEMANTIC_CACHE_TTL = float(os.environ.get('SEMANTIC_CACHE_TTL', '3600'))
+SEMANTIC_CACHE_SIZE = int(os.environ.get('SEMANTIC_CACHE_SIZE', '512'))
+# rewritten by milvus_upload.py whenever the FAQ collection is reloaded
+FAQ_VERSION_FILE = os.environ.get('FAQ_VERSION_FILE', './index/faq.version')
+
+
+# Supporting functions
+def read_version(path: str = FAQ_VERSION_FILE):
+    try:
+        with open(path, encoding='utf-8') as f:
+            return f.read().strip()
+    except FileNotFoundError:
+        return None
+
+def bump_version(path: str = FAQ_VERSION_FILE):
+    """ Marks the FAQ corpus as changed, which clears every process's semantic cache on its next lookup. """
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(f"{path}.tmp", 'w', encoding='utf-8') as f:
+        f.write(str(time.time_ns()))
+    os.replace(f"{path}.tmp", path)
+
+
+class SemanticCache:
+    """
+        Answers keyed by question embedding. A lookup hits when the cosine similarity to a stored
+        question is at least `threshold`; entries expire after `ttl` seconds and the least recently
+        used entry is evicted past `max_entries`. Entries stored without a vector (questions answered
+        by BM25 alone, see DOCSQNA.check_cache) are only found by their exact question text.
+    """
+
+    def __init__(self, threshold: float = SEMANTIC_CACHE_THRESHOLD, ttl: float = SEMANTIC_CACHE_TTL,
+                 max_entries: int = SEMANTIC_CACHE_SIZE, version_file: str = FAQ_VERSION_FILE):
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.version_file = version_file
+        self._version = read_version(version_file)
+        self._entries = OrderedDict()  # id -> (vector or None, question, answer, created_at)
+        self._by_text = {}  # normalized question -> id
+        self._matrix = None
+        self._ids = []
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _check_version(self):
+        version = read_version(self.version_file)
+        if version != self._version:
+            self._entries.clear()
+            self._by_text.clear()
+            self._matrix = None
+            self._version = version
+
+    def _purge_expired(self):
+        if not self.ttl:
+            return
+        deadline = time.monotonic() - self.ttl
+        expired = [entry_id for entry_id, entry in self._entries.items() if entry[3] < deadline]
+        for entry_id in expired:
+            self._drop(entry_id)
+        if expired:
+            self._matrix = None
+
+    def _drop(self, entry_id):
+        _, question, _, _ = self._entries.pop(entry_id)
+        if self._by_text.get(normalize_text(question)) == entry_id:
+            del self._by_text[normalize_text(question)]
+
+    def _hit(self, entry_id):
+        self._entries.move_to_end(entry_id)
+        self.hits += 1
+        return self._entries[entry_id][2]
+
+    def lookup(self, vector):
+        """ Returns the stored answer of the closest question above the threshold, or None. """
+        with self._lock:
+            self._check_version()
+            self._purge_expired()
+            if self._matrix is None:
+                self._ids = [entry_id for entry_id, entry in self._entries.items() if entry[0] is not None]
+                self._matrix = np.stack([self._entries[entry_id][0] for entry_id in self._ids]) if self._ids else None
+            if self._matrix is None:
+                self.misses += 1
+                return None
+
+            scores = self._matrix @ normalize_rows(vector)[0]
+            best = int(np.argmax(scores))
+            if scores[best] < self.threshold:
+                self.misses += 1
+                return None
+
+            return self._hit(self._ids[best])
+
+    def lookup_text(self, question: str):
+        """ Returns the stored answer of exactly this question (whitespace and unicode normalized), or None. """
+        with self._lock:
+            self._check_version()
+            self._purge_expired()
+            entry_id = self._by_text.get(normalize_text(question))
+            if entry_id is None:
+                self.misses += 1
+                return None
+            return self._hit(entry_id)
+
+    def store(self, vector, question: str, answer: str):
+        """ Stores an answer; with vector None it can only be found through lookup_text. """
+        with self._lock:
+            self._check_version()
+            previous = self._by_text.get(normalize_text(question))
+            if previous is not None:
+                self._drop(previous)
+            self._entries[self._next_id] = (normalize_rows(vector)[0] if vector is not None else None, question, answer, time.monotonic())
+            self._by_text[normalize_text(question)] = self._next_id
+            self._next_id += 1
+            while len(self._entries) > self.max_entries:
+                self._drop(next(iter(self._entries)))
+            self._matrix = None
+
+    def invalidate(self):
+        with self._lock:
+            self._entries.clear()
+            self._by_text.clear()
+            self._matrix = None
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses,
+                    "hit_rate": self.hits / lookups if lookups else 0.0}
+
+
+answer_cache = SemanticCache()
@@ -0,0 +1,59 @@
+import re
+import sqlite3
+
+# authorizer actions a read-only SELECT needs; everything else is denied
+_ALLOWED_ACTIONS = {
+    sqlite3.SQLITE_SELECT,
+    sqlite3.SQLITE_READ,
+    sqlite3.SQLITE_FUNCTION,
+    getattr(sqlite3, 'SQLITE_RECURSIVE', 33),
+}
+
+_FENCED_SQL = re.compile(r"```(?:sql|sqlite)?\s*(.+?)```", re.IGNORECASE | re.DOTALL)
+_READ_ONLY_START = re.compile(r"^\s*(SELECT|WITH)\b", re.IGNORECASE)
+
+
+def extract_sql(text: str):
+    """ Pulls the SQL statement out of an LLM reply, either a fenced block or a bare SELECT/WITH. """
+    if not text:
+        return None
+    match = _FENCED_SQL.search(text)
+    candidate = match.group(1) if match else text
+    candidate = candidate.strip().rstrip(';').strip()
+    if not _READ_ONLY_START.match(candidate):
+        return None
+    return candidate
+
+def _authorizer(action, arg1, arg2, db_name, trigger):
+    return sqlite3.SQLITE_OK if action in _ALLOWED_ACTIONS else sqlite3.SQLITE_DENY
+
+def validate_query(connection, query: str):
+    """
+        Checks a query locally without running it: it must be a single SELECT/WITH statement that sqlite
+        can compile, and compiling it must only need read access.
+
+        Args:
+        connection = sqlite3 connection to the target database
+        query = SQL text
+
+        Return:
+        (True, None) when the query is safe to execute, otherwise (False, reason)
+    """
+    if not query or not _READ_ONLY_START.match(query):
+        return False, "Only SELECT statements are allowed."
+
+    connection.set_authorizer(_authorizer)
+    try:
+        # EXPLAIN compiles the statement (catching syntax errors and unknown tables/columns) without running it
+        connection.execute(f"EXPLAIN {query}")
+    except sqlite3.DatabaseError as e:
+        message = str(e)
+        if "not authorized" in message:
+            return False, "Forbidden query: only read-only statements are allowed."
+        return False, message
+    except (sqlite3.Warning, sqlite3.ProgrammingError) as e:
+        # raised for multiple statements in one string
+        return False, str(e)
+    finally:
+        connection.set_authorizer(None)
+    return True, None
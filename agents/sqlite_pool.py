@@ -0,0 +1,141 @@
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from urllib.parse import quote
+
+POOL_SIZE = int(os.environ.get('SQLITE_POOL_SIZE', '5'))
+POOL_TIMEOUT = float(os.environ.get('SQLITE_POOL_TIMEOUT', '30'))
+
+
+class ConnectionPool:
+    """
+        Bounded pool of read-only SQLite connections for one database file.
+
+        Connections are opened with `check_same_thread=False` because the graph runs tools on
+        worker threads; the pool guarantees a connection is only checked out by one thread at a time.
+    """
+
+    def __init__(self, db_path: str, max_size: int = POOL_SIZE, timeout: float = POOL_TIMEOUT):
+        self.db_path = os.path.abspath(db_path)
+        self.max_size = max_size
+        self.timeout = timeout
+        self._idle = []
+        self._open = 0
+        self._waiting = 0
+        self._closed = False
+        self._cond = threading.Condition()
+        self._watcher = None
+        self._watcher_lock = threading.Lock()
+
+    def _connect(self):
+        # mode=ro refuses writes and never creates a missing database file
+        uri = f"file:{quote(self.db_path)}?mode=ro"
+        return sqlite3.connect(uri, uri=True, check_same_thread=False, timeout=self.timeout)
+
+    def acquire(self):
+        deadline = time.monotonic() + self.timeout
+        with self._cond:
+            while True:
+                if self._closed:
+                    raise RuntimeError(f"Connection pool for {self.db_path} is closed")
+                if self._idle:
+                    return self._idle.pop()
+                if self._open < self.max_size:
+                    self._open += 1
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise TimeoutError(f"No SQLite connection available for {self.db_path} after {self.timeout}s")
+                self._waiting += 1
+                try:
+                    self._cond.wait(remaining)
+                finally:
+                    self._waiting -= 1
+
+        # open outside the lock so a slow open does not block other threads
+        try:
+            return self._connect()
+        except Exception:
+            with self._cond:
+                self._open -= 1
+                self._cond.notify()
+            raise
+
+    def release(self, connection, discard: bool = False):
+        with self._cond:
+            if discard or self._closed:
+                self._open -= 1
+                connection.close()
+            else:
+                self._idle.append(connection)
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self):
+        connection = self.acquire()
+        discard = False
+        try:
+            yield connection
+        except (sqlite3.ProgrammingError, sqlite3.InterfaceError):
+            # the connection itself is unusable, do not hand it out again
+            discard = True
+            raise
+        finally:
+            self.release(connection, discard=discard)
+
+    def data_version(self) -> int:
+        """
+            PRAGMA data_version read from one dedicated connection. The value is only comparable
+            on the same connection, so pooled connections cannot be used for this.
+        """
+        with self._watcher_lock:
+            if self._watcher is None:
+                self._watcher = self._connect()
+            return self._watcher.execute("PRAGMA data_version;").fetchone()[0]
+
+    def metrics(self) -> dict:
+        with self._cond:
+            return {
+                "db_path": self.db_path,
+                "max_size": self.max_size,
+                "open": self._open,
+                "idle": len(self._idle),
+                "in_use": self._open - len(self._idle),
+                "waiting": self._waiting,
+            }
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            while self._idle:
+                self._idle.pop().close()
+                self._open -= 1
+            self._cond.notify_all()
+        with self._watcher_lock:
+            if self._watcher is not None:
+                self._watcher.close()
+                self._watcher = None
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+def get_pool(db_path: str) -> ConnectionPool:
+    """ Returns the process-wide pool of a database file, creating it on first use. """
+    key = os.path.realpath(db_path)
+    pool = _pools.get(key)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.setdefault(key, ConnectionPool(key))
+    return pool
+
+def pool_metrics() -> list:
+    return [pool.metrics() for pool in list(_pools.values())]
+
+def close_all():
+    with _pools_lock:
+        for pool in _pools.values():
+            pool.close()
+        _pools.clear()
@@ -0,0 +1,359 @@
+import atexit
+import bisect
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.tracers.context import register_configure_hook
+
+logger = logging.getLogger(__name__)
+
+# set AGENT_TELEMETRY=1 to instrument every graph run in the process
+TELEMETRY_ENV = 'AGENT_TELEMETRY'
+# finished spans are appended here as JSON lines
+TELEMETRY_SPANS_PATH = os.environ.get('TELEMETRY_SPANS_PATH')
+# Prometheus text written here at exit
+TELEMETRY_METRICS_PATH = os.environ.get('TELEMETRY_METRICS_PATH')
+# serves the Prometheus text on http://0.0.0.0:<port>/metrics
+TELEMETRY_PORT = os.environ.get('TELEMETRY_PORT')
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+# Prometheus-style metrics
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _label_text(names, values, extra: dict = None) -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    pairs += [f'{name}="{_escape(value)}"' for name, value in (extra or {}).items()]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labels: tuple = ()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = tuple(labels.get(name, "") for name in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            lines += [f"{self.name}{_label_text(self.labels, key)} {value}" for key, value in sorted(self._values.items())]
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, labels: tuple = (), buckets: tuple = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}  # label values -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(labels.get(name, "") for name in self.labels)
+        with self._lock:
+            series = self._series.setdefault(key, [0] * len(self.buckets) + [0.0, 0])
+            index = bisect.bisect_left(self.buckets, value)
+            if index < len(self.buckets):
+                series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, series in sorted(self._series.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets, series):
+                    cumulative += count
+                    lines.append(f"{self.name}_bucket{_label_text(self.labels, key, {'le': bound})} {cumulative}")
+                lines.append(f"{self.name}_bucket{_label_text(self.labels, key, {'le': '+Inf'})} {series[-1]}")
+                lines.append(f"{self.name}_sum{_label_text(self.labels, key)} {series[-2]}")
+                lines.append(f"{self.name}_count{_label_text(self.labels, key)} {series[-1]}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = {}
+        self._collectors = []
+        self._lock = threading.Lock()
+
+    def counter(self, name: str, help: str, labels: tuple = ()) -> Counter:
+        with self._lock:
+            return self._metrics.setdefault(name, Counter(name, help, labels))
+
+    def histogram(self, name: str, help: str, labels: tuple = (), buckets: tuple = DEFAULT_BUCKETS) -> Histogram:
+        with self._lock:
+            return self._metrics.setdefault(name, Histogram(name, help, labels, buckets))
+
+    def register_collector(self, collect):
+        """ collect() returns (name, type, help, [(labels dict, value)]) tuples, read at every render. """
+        with self._lock:
+            self._collectors.append(collect)
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+            collectors = list(self._collectors)
+        lines = [line for metric in metrics for line in metric.render()]
+        for collect in collectors:
+            try:
+                samples = collect()
+            except Exception as e:
+                logger.warning("metrics collector failed: %s", e)
+                continue
+            for name, kind, help, values in samples:
+                lines += [f"# HELP {name} {help}", f"# TYPE {name} {kind}"]
+                lines += [f"{name}{_label_text(labels.keys(), labels.values())} {value}" for labels, value in values]
+        return "\n".join(lines) + "\n"
+
+
+metrics = MetricsRegistry()
+NODE_SECONDS = metrics.histogram("agent_node_duration_seconds", "Wall time of a graph node.", ("graph", "node", "status"))
+LLM_SECONDS = metrics.histogram("agent_llm_duration_seconds", "Wall time of an LLM call.", ("model", "status"))
+TOOL_SECONDS = metrics.histogram("agent_tool_duration_seconds", "Wall time of a tool call, e.g. retrieval or SQL.", ("tool", "status"))
+LLM_TOKENS = metrics.counter("agent_llm_tokens_total", "LLM tokens by model and direction.", ("model", "type"))
+LLM_RETRIES = metrics.counter("agent_llm_retries_total", "LLM requests retried by the HTTP transport.", ("reason",))
+NODE_CACHE = metrics.counter("agent_node_cache_total", "Graph nodes answered from or missing a cache.", ("graph", "node", "result"))
+
+
+# Spans
+_spans_file = None
+_spans_lock = threading.Lock()
+
+def _export_span(span: dict):
+    global _spans_file
+    if not TELEMETRY_SPANS_PATH:
+        return
+    line = json.dumps(span, ensure_ascii=False, default=str)
+    with _spans_lock:
+        if _spans_file is None:
+            os.makedirs(os.path.dirname(TELEMETRY_SPANS_PATH) or '.', exist_ok=True)
+            _spans_file = open(TELEMETRY_SPANS_PATH, 'a', encoding='utf-8', buffering=1)
+        _spans_file.write(line + "\n")
+
+_open_spans = {}  # run id -> span being recorded
+_open_lock = threading.Lock()
+
+
+class TelemetryHandler(BaseCallbackHandler):
+    """
+        Records an OpenTelemetry-style span for every chain, LLM and tool run and feeds the
+        node, LLM and tool histograms. LangGraph nodes are the chain runs whose name matches
+        their `langgraph_node` metadata; the parent run names the graph.
+    """
+
+    def _start(self, kind: str, name: str, run_id, parent_run_id, metadata: dict, attributes: dict = None):
+        with _open_lock:
+            parent = _open_spans.get(parent_run_id)
+            span = {
+                "trace_id": parent["trace_id"] if parent else uuid.uuid4().hex,
+                "span_id": str(run_id),
+                "parent_span_id": str(parent_run_id) if parent_run_id else None,
+                "name": name,
+                "kind": kind,
+                "start_time_unix_nano": time.time_ns(),
+                "attributes": dict(attributes or {}),
+                "_start": time.perf_counter(),
+            }
+            metadata = metadata or {}
+            # a RunnableLambda node runs its function as a child run of the same name
+            if kind == "chain" and metadata.get("langgraph_node") == name and not (parent and parent["attributes"].get("node") == name):
+                span["attributes"].update({"graph": parent["name"] if parent else "", "node": name})
+            _open_spans[run_id] = span
+
+    def _end(self, run_id, error: BaseException = None, attributes: dict = None):
+        with _open_lock:
+            span = _open_spans.pop(run_id, None)
+        if span is None:
+            return None
+        duration = time.perf_counter() - span.pop("_start")
+        span["end_time_unix_nano"] = time.time_ns()
+        span["duration_ms"] = round(duration * 1000, 3)
+        span["status"] = "error" if error else "ok"
+        if error:
+            span["attributes"]["error"] = repr(error)
+        span["attributes"].update(attributes or {})
+
+        status = span["status"]
+        attributes = span["attributes"]
+        if "node" in attributes:
+            NODE_SECONDS.observe(duration, graph=attributes["graph"], node=attributes["node"], status=status)
+            if "cache_hit" in attributes:
+                NODE_CACHE.inc(graph=attributes["graph"], node=attributes["node"], result="hit" if attributes["cache_hit"] else "miss")
+        elif span["kind"] == "llm":
+            LLM_SECONDS.observe(duration, model=attributes.get("model", ""), status=status)
+        elif span["kind"] == "tool":
+            TOOL_SECONDS.observe(duration, tool=span["name"], status=status)
+        _export_span(span)
+        return span
+
+    # chains and graph nodes
+    def on_chain_start(self, serialized, inputs, *, run_id, parent_run_id=None, metadata=None, **kwargs):
+        self._start("chain", kwargs.get("name") or (serialized or {}).get("name", "chain"), run_id, parent_run_id, metadata)
+
+    def on_chain_end(self, outputs, *, run_id, **kwargs):
+        attributes = {}
+        if isinstance(outputs, dict) and "cache_hit" in outputs:
+            attributes["cache_hit"] = bool(outputs["cache_hit"])
+        self._end(run_id, attributes=attributes)
+
+    def on_chain_error(self, error, *, run_id, **kwargs):
+        self._end(run_id, error=error)
+
+    # LLM calls
+    def on_chat_model_start(self, serialized, messages, *, run_id, parent_run_id=None, metadata=None, **kwargs):
+        model = (metadata or {}).get("ls_model_name", "")
+        self._start("llm", kwargs.get("name") or "chat_model", run_id, parent_run_id, metadata, {"model": model})
+
+    def on_llm_start(self, serialized, prompts, *, run_id, parent_run_id=None, metadata=None, **kwargs):
+        model = (metadata or {}).get("ls_model_name", "")
+        self._start("llm", kwargs.get("name") or "llm", run_id, parent_run_id, metadata, {"model": model})
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        usage = (response.llm_output or {}).get("token_usage") or {}
+        input_tokens, output_tokens = usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0)
+        if not usage:
+            # streamed responses carry the usage on the message instead
+            for generations in response.generations:
+                for generation in generations:
+                    message_usage = getattr(getattr(generation, "message", None), "usage_metadata", None) or {}
+                    input_tokens += message_usage.get("input_tokens", 0)
+                    output_tokens += message_usage.get("output_tokens", 0)
+        span = self._end(run_id, attributes={"input_tokens": input_tokens, "output_tokens": output_tokens})
+        model = span["attributes"].get("model", "") if span else ""
+        LLM_TOKENS.inc(input_tokens, model=model, type="input")
+        LLM_TOKENS.inc(output_tokens, model=model, type="output")
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self._end(run_id, error=error)
+
+    def on_retry(self, retry_state, *, run_id, **kwargs):
+        LLM_RETRIES.inc(reason="runnable")
+
+    # tools (RAG retrieve, DBQNA SQL tools)
+    def on_tool_start(self, serialized, input_str, *, run_id, parent_run_id=None, metadata=None, **kwargs):
+        self._start("tool", kwargs.get("name") or (serialized or {}).get("name", "tool"), run_id, parent_run_id, metadata)
+
+    def on_tool_end(self, output, *, run_id, **kwargs):
+        self._end(run_id)
+
+    def on_tool_error(self, error, *, run_id, **kwargs):
+        self._end(run_id, error=error)
+
+
+# a handler in this variable (or AGENT_TELEMETRY=1) is attached to every run, including nested graphs
+_handler_var = ContextVar("agent_telemetry_handler", default=None)
+register_configure_hook(_handler_var, inheritable=True, handle_class=TelemetryHandler, env_var=TELEMETRY_ENV)
+
+@contextmanager
+def instrument():
+    """ Instruments the runs started inside the block, e.g. one benchmark or evaluation. """
+    token = _handler_var.set(TelemetryHandler())
+    try:
+        yield metrics
+    finally:
+        _handler_var.reset(token)
+
+
+# Cache and pool state, read when the metrics are rendered
+def _cache_samples():
+    samples = []
+    from agents.semantic_cache import answer_cache
+    from agents import query_cache
+    caches = {"semantic_answer": answer_cache.stats(), **{f"sql_{name}": stats for name, stats in query_cache.stats().items()}}
+
+    from agents.registry import is_built
+    if is_built("DOCSQNA"):
+        from agents.DOCSQNA import get_embeddings_model
+        # only report the embedding cache once DOCSQNA has created it
+        if get_embeddings_model.cache_info().currsize:
+            embedding_stats = get_embeddings_model().stats()
+            caches["embedding"] = {"hits": embedding_stats["memory_hits"] + embedding_stats["disk_hits"], "misses": embedding_stats["misses"]}
+
+    samples.append(("agent_cache_hits_total", "counter", "Cache hits since start.",
+                    [({"cache": name}, stats["hits"]) for name, stats in caches.items()]))
+    samples.append(("agent_cache_misses_total", "counter", "Cache misses since start.",
+                    [({"cache": name}, stats["misses"]) for name, stats in caches.items()]))
+
+    from agents.sqlite_pool import pool_metrics
+    pools = pool_metrics()
+    for field in ("open", "idle", "in_use", "waiting"):
+        samples.append((f"agent_sqlite_pool_{field}", "gauge", f"SQLite pool connections ({field}).",
+                        [({"db": pool["db_path"]}, pool[field]) for pool in pools]))
+    return samples
+
+metrics.register_collector(_cache_samples)
+
+
+# Exporters
+def write_metrics(path: str = TELEMETRY_METRICS_PATH):
+    if not path:
+        return
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(f"{path}.tmp", 'w', encoding='utf-8') as f:
+        f.write(metrics.render())
+    os.replace(f"{path}.tmp", path)
+
+
+class _MetricsRequestHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.rstrip('/') != '/metrics':
+            self.send_error(404)
+            return
+        body = metrics.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+_server = None
+_server_lock = threading.Lock()
+
+def serve_metrics(port: int):
+    """ Serves /metrics for a Prometheus scraper from a daemon thread, once per process. """
+    global _server
+    with _server_lock:
+        if _server is None:
+            _server = ThreadingHTTPServer(('0.0.0.0', int(port)), _MetricsRequestHandler)
+            threading.Thread(target=_server.serve_forever, name="telemetry-metrics", daemon=True).start()
+        return _server
+
+_metrics_file_registered = False
+
+def start_exporters():
+    """
+        Starts the exporters configured through TELEMETRY_PORT / TELEMETRY_METRICS_PATH. Called by the
+        entry points (pages/Lab 8.py, evaluate.py) rather than on import; safe to call on every rerun.
+    """
+    global _metrics_file_registered
+    # read now, so variables loaded from .env after this module was imported are honoured
+    port = os.environ.get('TELEMETRY_PORT', TELEMETRY_PORT)
+    path = os.environ.get('TELEMETRY_METRICS_PATH', TELEMETRY_METRICS_PATH)
+    if port:
+        serve_metrics(int(port))
+    with _server_lock:
+        if path and not _metrics_file_registered:
+            atexit.register(write_metrics, path)
+            _metrics_file_registered = True
@@ -0,0 +1,353 @@
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import ContextVar
+import argparse
+import asyncio
+import json
+import os
+import random
+import re
+import tempfile
+import time
+import zlib
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+from agents.lexical import tokenize
+
+BENCHMARK_AGENTS = "RAG,DBQNA,DOCSQNA"
+BENCHMARK_CONCURRENCY = "1,4,16"
+CHINOOK_DB = "sqlite/chinook.db"
+FAQ_PATH = "docs/FAQ Dexa Medica.pdf"
+FAKE_EMBEDDING_SIZE = 256
+
+# Chinook questions with the SQL the fake model writes for them, all pass sql_guard
+CHINOOK_QUESTIONS = {
+    "How many tracks are in the Rock genre?":
+        "SELECT COUNT(*) AS track_count FROM tracks t JOIN genres g ON g.GenreId = t.GenreId WHERE g.Name = 'Rock'",
+    "Which artist has the most albums?":
+        "SELECT ar.Name, COUNT(al.AlbumId) AS album_count FROM artists ar JOIN albums al ON al.ArtistId = ar.ArtistId "
+        "GROUP BY ar.ArtistId ORDER BY album_count DESC LIMIT 1",
+    "Who are the top 5 customers by total invoice amount?":
+        "SELECT c.FirstName, c.LastName, SUM(i.Total) AS total_spent FROM customers c JOIN invoices i ON i.CustomerId = c.CustomerId "
+        "GROUP BY c.CustomerId ORDER BY total_spent DESC LIMIT 5",
+    "What is the total sales per billing country?":
+        "SELECT BillingCountry, SUM(Total) AS total_sales FROM invoices GROUP BY BillingCountry ORDER BY total_sales DESC LIMIT 10",
+    "List the 10 longest tracks.":
+        "SELECT Name, Milliseconds FROM tracks ORDER BY Milliseconds DESC LIMIT 10",
+    "Which employee supports the most customers?":
+        "SELECT e.FirstName, e.LastName, COUNT(c.CustomerId) AS customer_count FROM employees e "
+        "JOIN customers c ON c.SupportRepId = e.EmployeeId GROUP BY e.EmployeeId ORDER BY customer_count DESC LIMIT 1",
+    "How many invoices were issued in 2010?":
+        "SELECT COUNT(*) AS invoice_count FROM invoices WHERE strftime('%Y', InvoiceDate) = '2010'",
+    "Which media types have the most tracks?":
+        "SELECT m.Name, COUNT(t.TrackId) AS track_count FROM media_types m JOIN tracks t ON t.MediaTypeId = m.MediaTypeId "
+        "GROUP BY m.MediaTypeId ORDER BY track_count DESC LIMIT 10",
+    "Which playlist has the most tracks?":
+        "SELECT p.Name, COUNT(pt.TrackId) AS track_count FROM playlists p JOIN playlist_track pt ON pt.PlaylistId = p.PlaylistId "
+        "GROUP BY p.PlaylistId ORDER BY track_count DESC LIMIT 1",
+    "What is the average track price per genre?":
+        "SELECT g.Name, AVG(t.UnitPrice) AS average_price FROM genres g JOIN tracks t ON t.GenreId = g.GenreId "
+        "GROUP BY g.GenreId ORDER BY average_price DESC LIMIT 10",
+    "Berapa total penjualan per tahun?":
+        "SELECT strftime('%Y', InvoiceDate) AS year, SUM(Total) AS total_sales FROM invoices GROUP BY year ORDER BY year",
+    "Sebutkan 10 lagu terlaris.":
+        "SELECT t.Name, SUM(ii.Quantity) AS sold FROM tracks t JOIN invoice_items ii ON ii.TrackId = t.TrackId "
+        "GROUP BY t.TrackId ORDER BY sold DESC LIMIT 10",
+}
+
+# model calls made while answering the current question
+_calls = ContextVar('benchmark_calls', default=None)
+
+def count_call(kind: str):
+    calls = _calls.get()
+    if calls is not None:
+        calls[kind] += 1
+
+def simulated_latency(latency: float, jitter: float, text: str) -> float:
+    # seeded by the input, so a replay waits exactly as long as the previous run
+    return max(0.0, latency * (1 + random.Random(zlib.crc32(text.encode('utf-8'))).uniform(-jitter, jitter)))
+
+
+# Fake models
+class FakeChatModel(BaseChatModel):
+    """
+        Deterministic stand-in for ChatOpenAI. Recognizes the prompts of the RAG, DBQNA and DOCSQNA
+        nodes and answers them from the prompt itself, after a configurable delay.
+    """
+
+    model_name: str = "fake-chat"
+    latency: float = 0.0
+    jitter: float = 0.0
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-chat"
+
+    def _reply(self, messages, tools) -> AIMessage:
+        prompt = "\n".join(str(message.content) for message in messages)
+        last = messages[-1]
+        human = next((message.content for message in messages if message.type == "human"), "")
+
+        # tool-calling nodes
+        if "retrieve" in tools and last.type == "human":
+            return _tool_call("retrieve", {"query": last.content})
+        if "get_table_schema" in tools:
+            db_name = re.search(r"db_name = (\S+)", prompt)
+            available = re.search(r"Available tables: (.*)", prompt)
+            table_list = re.findall(r"'(\w+)'", available.group(1)) if available else []
+            return _tool_call("get_table_schema", {"table_list": table_list, "db_name": db_name.group(1) if db_name else CHINOOK_DB})
+        if "running_query" in tools:
+            from agents.sql_guard import extract_sql
+            db_name = re.search(r"database_name = (\S+)", prompt)
+            return _tool_call("running_query", {"query": extract_sql(last.content) or "", "db_name": db_name.group(1) if db_name else CHINOOK_DB})
+
+        # DBQNA
+        if "Respond with the SQL query only." in prompt:
+            return AIMessage(content=f"```sql\n{CHINOOK_QUESTIONS.get(human, 'SELECT COUNT(*) FROM tracks')}\n```")
+        if "Double check the" in prompt:
+            return AIMessage(content=last.content)
+        if "Answer only with 'enough'" in prompt:
+            return AIMessage(content="enough")
+        if "Decide whether you can answer user question" in prompt:
+            result = prompt.split("Here is the query result:", 1)[-1].strip()
+            return AIMessage(content=f"Based on the database: {result[:300]}")
+
+        # DOCSQNA
+        if "Answer with True or False only." in prompt:
+            return AIMessage(content="True")
+        if "Improved query:" in prompt:
+            query = re.search(r"Original user query:\s*(.*)", prompt)
+            return AIMessage(content=query.group(1).strip() if query else human)
+        if "RAG Result:" in prompt:
+            answer = re.search(r"Answer: (.*?)(?:', '|\"\]|'\]|$)", prompt, re.DOTALL)
+            return AIMessage(content=answer.group(1).strip()[:500] if answer else "Maaf, tidak ditemukan.")
+
+        # RAG generate
+        if "question-answering tasks" in prompt:
+            content = re.search(r"Content: (.*)", prompt)
+            return AIMessage(content=content.group(1).strip()[:500] if content else "I don't know.")
+        return AIMessage(content="OK")
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        message = self._reply(messages, _tool_names(kwargs))
+        count_call("llm")
+        time.sleep(simulated_latency(self.latency, self.jitter, str(messages[-1].content)))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        message = self._reply(messages, _tool_names(kwargs))
+        count_call("llm")
+        await asyncio.sleep(simulated_latency(self.latency, self.jitter, str(messages[-1].content)))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def bind_tools(self, tools, tool_choice=None, **kwargs):
+        from langchain_core.utils.function_calling import convert_to_openai_tool
+        return self.bind(tools=[convert_to_openai_tool(tool) for tool in tools], **kwargs)
+
+
+def _tool_call(name: str, args: dict) -> AIMessage:
+    return AIMessage(content="", tool_calls=[{"name": name, "args": args, "id": f"call_{name}_{zlib.crc32(json.dumps(args).encode('utf-8'))}", "type": "tool_call"}])
+
+def _tool_names(kwargs) -> set:
+    return {tool["function"]["name"] for tool in kwargs.get("tools", ())}
+
+
+class FakeEmbeddings(Embeddings):
+    """ Hashed bag-of-words vectors: deterministic, and texts sharing terms are close, like a real model. """
+
+    def __init__(self, model: str, size: int = FAKE_EMBEDDING_SIZE, latency: float = 0.0, jitter: float = 0.0):
+        self.model = model
+        self.size = size
+        self.latency = latency
+        self.jitter = jitter
+
+    def _vector(self, text: str) -> list:
+        vector = np.zeros(self.size)
+        for term in tokenize(text) or [text]:
+            vector[zlib.crc32(term.encode('utf-8')) % self.size] += 1.0
+        return (vector / np.linalg.norm(vector)).tolist()
+
+    def embed_documents(self, texts: list) -> list:
+        count_call("embedding")
+        time.sleep(simulated_latency(self.latency, self.jitter, "".join(texts[:1])))
+        return [self._vector(text) for text in texts]
+
+    def embed_query(self, text: str) -> list:
+        count_call("embedding")
+        time.sleep(simulated_latency(self.latency, self.jitter, text))
+        return self._vector(text)
+
+    async def aembed_query(self, text: str) -> list:
+        count_call("embedding")
+        await asyncio.sleep(simulated_latency(self.latency, self.jitter, text))
+        return self._vector(text)
+
+
+# Setup
+def configure_environment(workdir: str):
+    """ Points every index, cache and database path at the work directory. Must run before the agents are imported. """
+    index_dir = os.path.join(workdir, "index")
+    os.environ['INDEX_DIR'] = index_dir
+    os.environ['FAQ_BACKEND'] = 'local'
+    os.environ['FAQ_INDEX_PATH'] = os.path.join(index_dir, 'faq')
+    os.environ['FAQ_VERSION_FILE'] = os.path.join(index_dir, 'faq.version')
+    os.environ['FAQ_MANIFEST_PATH'] = os.path.join(index_dir, 'faq_manifest.json')
+    os.environ['DB_PATH'] = CHINOOK_DB
+    os.environ.pop('EMBEDDING_CACHE_PATH', None)
+
+def prepare(agents: list, llm_latency: float, embedding_latency: float, jitter: float):
+    """
+        Installs the fake models, builds the local FAQ and document indexes and the graphs,
+        so index building and imports are not part of the measurements.
+
+        Return:
+        questions per agent
+    """
+    from agents.llm import use_models
+    use_models(
+        chat=lambda model, **kwargs: FakeChatModel(model_name=model, latency=llm_latency, jitter=jitter),
+        embeddings=lambda model: FakeEmbeddings(model, latency=embedding_latency, jitter=jitter),
+    )
+
+    from milvus_upload import load_faq_records, sync_faq
+    faq_records = load_faq_records(FAQ_PATH)
+    sync_faq(faq_records, full=True)
+    faq_questions = [record['question'] for record in faq_records]
+
+    from agents.registry import get_graph
+    from agents import schema_catalog
+    for agent in agents:
+        get_graph(agent)
+    if "RAG" in agents:
+        from agents.RAG import get_vector_store
+        get_vector_store()
+    if "DBQNA" in agents:
+        schema_catalog.get_catalog(CHINOOK_DB)
+
+    questions = {"RAG": faq_questions, "DOCSQNA": faq_questions, "DBQNA": list(CHINOOK_QUESTIONS)}
+    return {agent: questions[agent] for agent in agents}
+
+def reset_caches():
+    # every concurrency level starts cold, otherwise the second level replays cached answers
+    from agents import query_cache
+    from agents.semantic_cache import answer_cache
+    from agents.DOCSQNA import get_embeddings_model
+    answer_cache.invalidate()
+    query_cache.result_cache.clear()
+    query_cache.question_cache.clear()
+    get_embeddings_model().memory.clear()
+
+
+# Measurement
+def ask(agent: str, question: str) -> dict:
+    from agents.fanout import agent_answer, agent_input
+    from agents.registry import get_graph
+    calls = {"llm": 0, "embedding": 0}
+    _calls.set(calls)
+    start = time.perf_counter()
+    try:
+        answer, error = agent_answer(agent, get_graph(agent).invoke(agent_input(agent, question))), None
+    except Exception as e:
+        answer, error = "", repr(e)
+    return {"question": question, "seconds": time.perf_counter() - start, "answer": answer, "error": error, **calls}
+
+async def aask(agent: str, question: str) -> dict:
+    from agents.fanout import agent_answer, agent_input
+    from agents.registry import get_graph
+    calls = {"llm": 0, "embedding": 0}
+    # each task runs in its own copy of the context
+    _calls.set(calls)
+    start = time.perf_counter()
+    try:
+        answer, error = agent_answer(agent, await get_graph(agent).ainvoke(agent_input(agent, question))), None
+    except Exception as e:
+        answer, error = "", repr(e)
+    return {"question": question, "seconds": time.perf_counter() - start, "answer": answer, "error": error, **calls}
+
+def run_level(agent: str, questions: list, concurrency: int, mode: str = "sync") -> list:
+    if mode == "async":
+        async def run_all():
+            semaphore = asyncio.Semaphore(concurrency)
+
+            async def bounded(question):
+                async with semaphore:
+                    return await aask(agent, question)
+
+            return await asyncio.gather(*(bounded(question) for question in questions))
+        return asyncio.run(run_all())
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        return list(executor.map(lambda question: ask(agent, question), questions))
+
+def summarize(agent: str, mode: str, concurrency: int, results: list, wall_seconds: float) -> dict:
+    seconds = np.array([result['seconds'] for result in results])
+    p50, p95, p99 = np.percentile(seconds, [50, 95, 99]) if len(seconds) else (0.0, 0.0, 0.0)
+    return {
+        "agent": agent,
+        "mode": mode,
+        "concurrency": concurrency,
+        "questions": len(results),
+        "errors": sum(1 for result in results if result['error']),
+        "p50_ms": p50 * 1000,
+        "p95_ms": p95 * 1000,
+        "p99_ms": p99 * 1000,
+        "llm_calls_per_question": float(np.mean([result['llm'] for result in results])) if results else 0.0,
+        "embedding_calls_per_question": float(np.mean([result['embedding'] for result in results])) if results else 0.0,
+        "throughput_qps": len(results) / wall_seconds if wall_seconds else 0.0,
+    }
+
+def print_table(rows: list):
+    header = f"{'agent':<8} {'mode':<5} {'conc':>4} {'n':>4} {'err':>4} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'llm/q':>6} {'emb/q':>6} {'q/s':>7}"
+    print(header)
+    print("-" * len(header))
+    for row in rows:
+        print(f"{row['agent']:<8} {row['mode']:<5} {row['concurrency']:>4} {row['questions']:>4} {row['errors']:>4} "
+              f"{row['p50_ms']:>8.1f} {row['p95_ms']:>8.1f} {row['p99_ms']:>8.1f} "
+              f"{row['llm_calls_per_question']:>6.2f} {row['embedding_calls_per_question']:>6.2f} {row['throughput_qps']:>7.2f}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay the FAQ and Chinook questions against the agents with fake models and report latency and throughput.")
+    parser.add_argument('--agents', default=BENCHMARK_AGENTS, help="Comma-separated registry names.")
+    parser.add_argument('--concurrency', default=BENCHMARK_CONCURRENCY, help="Comma-separated numbers of questions in flight.")
+    parser.add_argument('--mode', choices=['sync', 'async'], default='sync', help="invoke in a thread pool or ainvoke on one event loop.")
+    parser.add_argument('--llm-latency', type=float, default=0.3, help="Seconds per fake chat completion.")
+    parser.add_argument('--embedding-latency', type=float, default=0.05, help="Seconds per fake embedding request.")
+    parser.add_argument('--jitter', type=float, default=0.2, help="Latency varies by up to this fraction, seeded by the input.")
+    parser.add_argument('--limit', type=int, default=None, help="Questions per agent, all by default.")
+    parser.add_argument('--repeat', type=int, default=1, help="Replay the question set this many times per level.")
+    parser.add_argument('--warm-caches', action='store_true', help="Keep answer, SQL and embedding caches between levels.")
+    parser.add_argument('--workdir', default=None, help="Where the fake indexes are written, a temporary directory by default.")
+    parser.add_argument('--output', default=None, help="Also write the results as JSON to this path.")
+    args = parser.parse_args()
+
+    agents = [agent.strip() for agent in args.agents.split(',') if agent.strip()]
+    levels = [int(level) for level in args.concurrency.split(',')]
+    with tempfile.TemporaryDirectory(prefix="agent-benchmark-") as tmp:
+        # the fake vectors must never end up in the real ./index
+        configure_environment(args.workdir or tmp)
+        questions = prepare(agents, args.llm_latency, args.embedding_latency, args.jitter)
+
+        rows = []
+        for agent in agents:
+            replay = questions[agent][:args.limit] * args.repeat
+            for concurrency in levels:
+                if not args.warm_caches:
+                    reset_caches()
+                start = time.perf_counter()
+                results = run_level(agent, replay, concurrency, args.mode)
+                rows.append(summarize(agent, args.mode, concurrency, results, time.perf_counter() - start))
+                for result in results:
+                    if result['error']:
+                        print(f"{agent}: {result['question']!r} failed: {result['error']}")
+
+    print_table(rows)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(rows, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,198 @@
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import lru_cache
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+FAQ_PATH = "docs/FAQ Dexa Medica.pdf"
+EVAL_AGENT = os.environ.get('EVAL_AGENT', 'DOCSQNA')
+EVAL_WORKERS = int(os.environ.get('EVAL_WORKERS', '8'))
+EVAL_CHECKPOINT_PATH = os.environ.get('EVAL_CHECKPOINT_PATH', 'eval_checkpoint.jsonl')
+EVAL_OUTPUT_PATH = os.environ.get('EVAL_OUTPUT_PATH', 'eval_results.csv')
+# pairs scored together by one pass of the vectorized LCS
+SCORE_BATCH_SIZE = int(os.environ.get('SCORE_BATCH_SIZE', '256'))
+
+
+# Supporting functions
+def load_dataset(path=FAQ_PATH) -> pd.DataFrame:
+    """ Question/answer pairs from the FAQ PDF, or from a CSV with question and answer columns (e.g. the notebook's qna.csv). """
+    from milvus_upload import load_faq_records, question_id
+    if path.lower().endswith('.csv'):
+        df = pd.read_csv(path)[['question', 'answer']]
+    else:
+        df = pd.DataFrame.from_records(load_faq_records(path), columns=['question', 'answer'])
+    df = df.fillna('')
+    df['id'] = df['question'].map(question_id)
+    # a repeated question keeps its last answer, as in the FAQ manifest
+    return df.drop_duplicates('id', keep='last').reset_index(drop=True)
+
+def load_checkpoint(path=EVAL_CHECKPOINT_PATH, agent: str = EVAL_AGENT) -> dict:
+    """
+        id -> result of every question `agent` answered in an earlier, possibly crashed, run.
+        Rows of other agents sharing the file are ignored, so switching --agent never reuses their answers.
+    """
+    results = {}
+    if not os.path.exists(path):
+        return results
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            try:
+                result = json.loads(line)
+            except json.JSONDecodeError:
+                # the line being written when the run died
+                continue
+            if result.get('agent') == agent:
+                results[result['id']] = result
+    return results
+
+def ask(agent: str, question: str) -> dict:
+    from agents.fanout import agent_answer, agent_input
+    from agents.registry import get_graph
+    start = time.perf_counter()
+    try:
+        answer, error = agent_answer(agent, get_graph(agent).invoke(agent_input(agent, question))), None
+    except Exception as e:
+        answer, error = "", repr(e)
+    return {"llm_answer": answer, "seconds": time.perf_counter() - start, "error": error}
+
+def run_questions(df: pd.DataFrame, agent: str = EVAL_AGENT, workers: int = EVAL_WORKERS,
+                  checkpoint_path: str = EVAL_CHECKPOINT_PATH, retry_errors: bool = True) -> dict:
+    """
+        Answers every question not yet in the checkpoint with up to `workers` questions in flight.
+        Each result is appended to the checkpoint as soon as it arrives, so a crashed run resumes
+        where it stopped.
+
+        Return:
+        id -> result of `agent` for every question of df
+    """
+    results = load_checkpoint(checkpoint_path, agent)
+    done = {qid for qid, result in results.items() if not (retry_errors and result.get('error'))}
+    pending = df[~df['id'].isin(done)]
+    print(f"{len(df) - len(pending)} questions already answered, {len(pending)} to go")
+    if pending.empty:
+        return results
+
+    os.makedirs(os.path.dirname(checkpoint_path) or '.', exist_ok=True)
+    if os.path.exists(checkpoint_path) and os.path.getsize(checkpoint_path):
+        with open(checkpoint_path, 'rb') as f:
+            f.seek(-1, os.SEEK_END)
+            partial = f.read(1) != b"\n"
+        if partial:
+            # start a new line after the half-written one
+            with open(checkpoint_path, 'a', encoding='utf-8') as f:
+                f.write("\n")
+    with open(checkpoint_path, 'a', encoding='utf-8') as checkpoint, ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(ask, agent, row.question): row for row in pending.itertuples()}
+        for i, future in enumerate(as_completed(futures), start=1):
+            row = futures[future]
+            result = {"id": row.id, "question": row.question, "agent": agent, **future.result()}
+            checkpoint.write(json.dumps(result, ensure_ascii=False) + "\n")
+            checkpoint.flush()
+            results[row.id] = result
+            status = f"failed: {result['error']}" if result['error'] else f"{result['seconds']:.1f}s"
+            print(f"[{i}/{len(pending)}] {row.question[:60]} {status}")
+    return results
+
+
+# ROUGE-L
+@lru_cache(maxsize=None)
+def get_tokenizer():
+    # same tokenization as rouge_scorer.RougeScorer(['rougeL'], use_stemmer=True)
+    from rouge_score.tokenizers import DefaultTokenizer
+    return DefaultTokenizer(use_stemmer=True)
+
+def _token_ids(texts: list, vocabulary: dict) -> list:
+    tokenizer = get_tokenizer()
+    return [np.array([vocabulary.setdefault(token, len(vocabulary)) for token in tokenizer.tokenize(text)], dtype=np.int64) for text in texts]
+
+def _pad(sequences: list, fill: int) -> np.ndarray:
+    padded = np.full((len(sequences), max([len(sequence) for sequence in sequences] + [1])), fill, dtype=np.int64)
+    for i, sequence in enumerate(sequences):
+        padded[i, :len(sequence)] = sequence
+    return padded
+
+def lcs_lengths(references: list, hypotheses: list) -> np.ndarray:
+    """
+        Longest common subsequence of each (reference, hypothesis) pair of token id arrays.
+        The DP runs one reference position at a time for the whole batch: a row is
+        max(previous row, previous row shifted by one plus a match) followed by a running maximum.
+    """
+    # different fill values, so padding never matches
+    reference = _pad(references, -1)
+    hypothesis = _pad(hypotheses, -2)
+    lengths = np.array([len(sequence) for sequence in references])
+    row = np.zeros((len(references), hypothesis.shape[1] + 1), dtype=np.int64)
+    for i in range(reference.shape[1]):
+        match = reference[:, i:i + 1] == hypothesis
+        candidate = np.maximum(row[:, 1:], row[:, :-1] + match)
+        new_row = np.concatenate([row[:, :1], np.maximum.accumulate(candidate, axis=1)], axis=1)
+        # references shorter than i keep their final row
+        row = np.where((i < lengths)[:, None], new_row, row)
+    return row[:, -1]
+
+def rouge_l_f1(references: list, hypotheses: list, batch_size: int = SCORE_BATCH_SIZE) -> np.ndarray:
+    """ ROUGE-L F1 of every pair, equal to RougeScorer(['rougeL'], use_stemmer=True).score(reference, hypothesis).fmeasure. """
+    vocabulary = {}
+    scores = []
+    for start in range(0, len(references), batch_size):
+        reference_ids = _token_ids(references[start:start + batch_size], vocabulary)
+        hypothesis_ids = _token_ids(hypotheses[start:start + batch_size], vocabulary)
+        lcs = lcs_lengths(reference_ids, hypothesis_ids)
+        reference_lengths = np.array([len(ids) for ids in reference_ids])
+        hypothesis_lengths = np.array([len(ids) for ids in hypothesis_ids])
+        with np.errstate(divide='ignore', invalid='ignore'):
+            precision = np.where(hypothesis_lengths > 0, lcs / hypothesis_lengths, 0.0)
+            recall = np.where(reference_lengths > 0, lcs / reference_lengths, 0.0)
+            scores.append(np.where(precision + recall > 0, 2 * precision * recall / (precision + recall), 0.0))
+    return np.concatenate(scores) if scores else np.array([])
+
+
+def score(df: pd.DataFrame, results: dict) -> pd.DataFrame:
+    scored = df.copy()
+    scored['llm_answer'] = scored['id'].map(lambda qid: results.get(qid, {}).get('llm_answer', ''))
+    scored['seconds'] = scored['id'].map(lambda qid: results.get(qid, {}).get('seconds', np.nan))
+    scored['error'] = scored['id'].map(lambda qid: results.get(qid, {}).get('error'))
+    scored['rouge_l_f1'] = rouge_l_f1(scored['answer'].tolist(), scored['llm_answer'].tolist())
+    return scored
+
+def print_summary(scored: pd.DataFrame):
+    answered = scored[scored['error'].isna()]
+    print(f"questions: {len(scored)}, failed: {len(scored) - len(answered)}")
+    if answered.empty:
+        return
+    p50, p95, p99 = np.percentile(answered['seconds'], [50, 95, 99])
+    print(f"ROUGE-L F1 mean: {answered['rouge_l_f1'].mean():.4f}, median: {answered['rouge_l_f1'].median():.4f}")
+    print(f"latency p50: {p50:.2f}s, p95: {p95:.2f}s, p99: {p99:.2f}s, mean: {answered['seconds'].mean():.2f}s")
+
+def main():
+    parser = argparse.ArgumentParser(description="Answer the FAQ questions with an agent in parallel and score the answers with ROUGE-L.")
+    parser.add_argument('--dataset', default=FAQ_PATH, help="FAQ PDF or CSV with question and answer columns.")
+    parser.add_argument('--agent', default=EVAL_AGENT, help="Registry name of the agent to evaluate.")
+    parser.add_argument('--workers', type=int, default=EVAL_WORKERS, help="Questions in flight at once.")
+    parser.add_argument('--checkpoint', default=EVAL_CHECKPOINT_PATH, help="JSONL file answers are appended to; an existing one is resumed.")
+    parser.add_argument('--output', default=EVAL_OUTPUT_PATH, help="CSV with answer, ROUGE-L and latency per question.")
+    parser.add_argument('--limit', type=int, default=None, help="Only evaluate the first questions of the dataset.")
+    parser.add_argument('--fresh', action='store_true', help="Delete the checkpoint and answer every question again.")
+    parser.add_argument('--keep-errors', action='store_true', help="Do not retry questions that failed in an earlier run.")
+    args = parser.parse_args()
+
+    from agents.telemetry import start_exporters
+    start_exporters()
+    if args.fresh and os.path.exists(args.checkpoint):
+        os.remove(args.checkpoint)
+    df = load_dataset(args.dataset)
+    if args.limit:
+        df = df.head(args.limit)
+
+    results = run_questions(df, args.agent, args.workers, args.checkpoint, retry_errors=not args.keep_errors)
+    scored = score(df, results)
+    scored[['id', 'question', 'answer', 'llm_answer', 'rouge_l_f1', 'seconds', 'error']].to_csv(args.output, index=False)
+    print_summary(scored)
+    print(f"Results written to {args.output}")
+
+if __name__ == "__main__":
+    main()
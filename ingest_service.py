@@ -0,0 +1,230 @@
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from multiprocessing import Manager
+from queue import Empty
+from itertools import islice
+import argparse
+import json
+import os
+import re
+import time
+
+from agents.index_store import INDEX_DIR, DocumentWriter, file_sha256, is_indexed
+
+INGEST_WORKERS = int(os.environ.get('INGEST_WORKERS', str(os.cpu_count() or 2)))
+INGEST_BATCH_SIZE = int(os.environ.get('INGEST_BATCH_SIZE', '64'))
+INGEST_STATE_PATH = os.environ.get('INGEST_STATE_PATH', os.path.join(INDEX_DIR, 'ingest_state.json'))
+WATCH_INTERVAL = float(os.environ.get('WATCH_INTERVAL', '10'))
+# embedding requests in flight while the parsers keep going
+INGEST_EMBED_WORKERS = int(os.environ.get('INGEST_EMBED_WORKERS', '4'))
+# the separator milvus_upload.split_by_numbered_items splits FAQ items on
+NUMBERED_ITEM = r'\d+\.'
+
+
+# Supporting functions
+def choose_strategy(path):
+    # FAQ documents are numbered Q&A lists, everything else is prose for the RAG agent
+    return "faq" if "faq" in os.path.basename(path).lower() else "recursive"
+
+def batched(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+def iter_pages(path, strategy):
+    """ Yields one page at a time, so a worker never holds the whole parsed PDF. """
+    # same loaders as milvus_upload.py (FAQ) and agents/RAG.py (company profile)
+    from langchain_community.document_loaders import PyMuPDFLoader, PyPDFLoader
+    loader = PyMuPDFLoader(path) if strategy == "faq" else PyPDFLoader(path)
+    yield from loader.lazy_load()
+
+def iter_chunks(path, strategy):
+    """
+        Yields the chunks of a document as its pages are parsed. FAQ chunks are {question, answer}
+        records, recursive chunks are {page_content, metadata} records.
+    """
+    if strategy == "faq":
+        from milvus_upload import parse_qna
+        # only the last numbered item of a page may continue on the next one, so that item is
+        # carried over and every item before it is parsed right away
+        carry = ""
+        for page in iter_pages(path, strategy):
+            text = carry + page.page_content
+            last = None
+            for last in re.finditer(NUMBERED_ITEM, text):
+                pass
+            if last is None:
+                carry = text
+                continue
+            yield from parse_qna(text[:last.start()])
+            carry = text[last.start():]
+        yield from parse_qna(carry)
+        return
+
+    from agents.RAG import text_splitter
+    for page in iter_pages(path, strategy):
+        for split in text_splitter.split_documents([page]):
+            yield {"page_content": split.page_content, "metadata": split.metadata}
+
+def parse_document(path, strategy, queue, batch_size=INGEST_BATCH_SIZE):
+    """
+        Runs in a worker process: sends (path, strategy, batch of chunks) to the queue as soon as
+        each batch is parsed, then (path, strategy, None) once the document is done or failed.
+    """
+    try:
+        for batch in batched(iter_chunks(path, strategy), batch_size):
+            queue.put((path, strategy, batch))
+    finally:
+        queue.put((path, strategy, None))
+
+def load_state(path=INGEST_STATE_PATH):
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+def save_state(state, path=INGEST_STATE_PATH):
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(f"{path}.tmp", 'w', encoding='utf-8') as f:
+        json.dump(state, f, indent=2)
+    os.replace(f"{path}.tmp", path)
+
+
+# Sinks
+def write_faq(path, records):
+    from milvus_upload import sync_faq
+    # the FAQ manifest is scoped by source, so ./docs/x.pdf and docs/x.pdf must be the same source
+    return sync_faq(records, source=os.path.normpath(path))
+
+def embed_chunks(chunks):
+    from agents.RAG import get_embedding_model
+    return get_embedding_model().embed_documents([chunk["page_content"] for chunk in chunks])
+
+def document_writer(path):
+    from agents.RAG import EMBEDDING_MODEL_NAME, text_splitter
+    return DocumentWriter(path, text_splitter._chunk_size, text_splitter._chunk_overlap, EMBEDDING_MODEL_NAME)
+
+
+def needs_ingest(path, strategy, state):
+    entry = state.get(os.path.normpath(path), {})
+    stat = os.stat(path)
+    if entry.get('size') == stat.st_size and entry.get('mtime_ns') == stat.st_mtime_ns:
+        return False
+    if strategy == "recursive":
+        from agents.RAG import EMBEDDING_MODEL_NAME, text_splitter
+        if is_indexed(path, text_splitter._chunk_size, text_splitter._chunk_overlap, EMBEDDING_MODEL_NAME):
+            return False
+    return entry.get('sha256') != file_sha256(path)
+
+def ingest(paths, workers=INGEST_WORKERS, batch_size=INGEST_BATCH_SIZE, force=False, embed_workers=INGEST_EMBED_WORKERS):
+    """
+        Parses documents in a process pool and embeds their chunks batch by batch while parsing
+        continues. Company-profile chunks are appended to the document's index as their vectors
+        arrive and published once the last batch is written; FAQ pairs are synced once the document
+        is parsed, since deletions are computed against the whole document. Unchanged documents
+        are skipped unless force is set.
+
+        Return:
+        number of chunks written per document
+    """
+    state = load_state()
+    jobs = list(dict.fromkeys((os.path.normpath(path), choose_strategy(path)) for path in paths if path.lower().endswith('.pdf')))
+    jobs = [(path, strategy) for path, strategy in jobs if force or needs_ingest(path, strategy, state)]
+    written = {}
+    if not jobs:
+        return written
+
+    records = {path: [] for path, strategy in jobs if strategy == "faq"}
+    writers = {}
+    # per document, embeddings in flight in chunk order
+    pending = {path: deque() for path, strategy in jobs if strategy == "recursive"}
+
+    def drain(path, wait=False):
+        # append finished embeddings in order; with wait, also the ones still running
+        while pending[path] and (wait or pending[path][0][0].done()):
+            future, batch = pending[path].popleft()
+            writers[path].append(future.result(), batch)
+            print(f"{path}: embedded {writers[path].writer.count} chunks")
+
+    # chunks stream back from the parsers, so embedding starts with the first batch of the first document
+    try:
+        with Manager() as manager, ProcessPoolExecutor(max_workers=min(workers, len(jobs))) as executor, \
+                ThreadPoolExecutor(max_workers=embed_workers) as embedder:
+            queue = manager.Queue()
+            futures = {path: executor.submit(parse_document, path, strategy, queue, batch_size) for path, strategy in jobs}
+            while futures:
+                try:
+                    path, strategy, batch = queue.get(timeout=1)
+                except Empty:
+                    # a worker that died without reaching its finally block never sends its end marker
+                    for future in futures.values():
+                        if future.done() and future.exception() is not None:
+                            raise future.exception()
+                    continue
+                if batch is not None:
+                    if strategy == "faq":
+                        records[path] += batch
+                        continue
+                    if path not in writers:
+                        writers[path] = document_writer(path)
+                    pending[path].append((embedder.submit(embed_chunks, batch), batch))
+                    # bounded memory: a document never has more batches in flight than there are embedders
+                    drain(path, wait=len(pending[path]) > embed_workers)
+                    continue
+
+                # raises if the parser failed, before anything of the document is published
+                futures.pop(path).result()
+                if strategy == "faq":
+                    written[path] = write_faq(path, records.pop(path))
+                else:
+                    if path not in writers:
+                        writers[path] = document_writer(path)
+                    drain(path, wait=True)
+                    written[path] = writers.pop(path).commit()
+
+                stat = os.stat(path)
+                state[os.path.normpath(path)] = {"sha256": file_sha256(path), "size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "strategy": strategy}
+                save_state(state)
+    finally:
+        # documents left unfinished by a failure keep their previous index
+        for writer in writers.values():
+            writer.abort()
+    return written
+
+def list_documents(directory):
+    return sorted(
+        os.path.join(root, name)
+        for root, _, names in os.walk(directory)
+        for name in names if name.lower().endswith('.pdf')
+    )
+
+def watch(directory, interval=WATCH_INTERVAL, workers=INGEST_WORKERS, batch_size=INGEST_BATCH_SIZE):
+    """ Polls a directory and ingests new or modified PDFs until interrupted. """
+    print(f"Watching {directory} every {interval}s")
+    while True:
+        written = ingest(list_documents(directory), workers=workers, batch_size=batch_size)
+        for path, count in written.items():
+            print(f"Ingested {path}: {count} chunks")
+        time.sleep(interval)
+
+def main():
+    parser = argparse.ArgumentParser(description="Ingest PDF documents into the FAQ and company-profile vector stores.")
+    parser.add_argument('paths', nargs='*', help="PDF files to ingest, e.g. newly uploaded documents")
+    parser.add_argument('--watch', metavar='DIR', help="Keep polling DIR for new or changed PDFs")
+    parser.add_argument('--interval', type=float, default=WATCH_INTERVAL)
+    parser.add_argument('--workers', type=int, default=INGEST_WORKERS)
+    parser.add_argument('--batch-size', type=int, default=INGEST_BATCH_SIZE)
+    parser.add_argument('--force', action='store_true', help="Re-ingest even if a document did not change")
+    args = parser.parse_args()
+
+    if args.paths:
+        paths = [path for arg in args.paths for path in (list_documents(arg) if os.path.isdir(arg) else [arg])]
+        for path, count in ingest(paths, args.workers, args.batch_size, args.force).items():
+            print(f"Ingested {path}: {count} chunks")
+    if args.watch:
+        watch(args.watch, args.interval, args.workers, args.batch_size)
+    if not args.paths and not args.watch:
+        parser.print_help()
+
+if __name__ == "__main__":
+    main()
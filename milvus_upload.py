@@ -1,15 +1,27 @@
 from langchain_community.document_loaders import PyMuPDFLoader
-from langchain_openai import OpenAIEmbeddings
-from pymilvus import MilvusClient
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import openai
 import pandas as pd
+import argparse
+import hashlib
+import json
 import os
 import re
+import time
+from agents.faq_backend import FAQ_BACKEND, LocalBackend
+from agents.llm import get_embeddings_model, retry_delay
+from agents.milvus_client import MILVUS_COLLECTION, get_client
+from agents.semantic_cache import bump_version
 
 OPENAI_API_KEY = os.environ.get('OPENAI_API_KEY')
-embeddings_model = OpenAIEmbeddings(openai_api_key = OPENAI_API_KEY)
+FAQ_PATH = "docs/FAQ Dexa Medica.pdf"
+EMBED_BATCH_SIZE = int(os.environ.get('EMBED_BATCH_SIZE', '64'))
+EMBED_WORKERS = int(os.environ.get('EMBED_WORKERS', '4'))
+INSERT_CHUNK_SIZE = int(os.environ.get('INSERT_CHUNK_SIZE', '500'))
+FAQ_MANIFEST_PATH = os.environ.get('FAQ_MANIFEST_PATH', './index/faq_manifest.json')
+DELETE_CHUNK_SIZE = 100
+MAX_RETRIES = 6
 
-def get_embedding(text):
-    return embeddings_model.embed_query(text)
 
 def split_by_numbered_items(text, keep_separators=True):
     pattern = r'(\d+\.)'
@@ -40,26 +52,159 @@ def split_by_numbered_items(text, keep_separators=True):
     
     return result
 
-loader = PyMuPDFLoader("docs/FAQ Dexa Medica.pdf")
-docs = loader.load()
-chunk_text = split_by_numbered_items(''.join([doc.page_content for doc in docs]), keep_separators=False)
-qna_result = [
-    {
-        "question": chunk.split('?', 1)[0].strip() + '?',
-        "answer": chunk.split('?', 1)[1].strip() if '?' in chunk else ''
-    }
-    for chunk in chunk_text if '?' in chunk
-]
-
-df = pd.DataFrame.from_records(qna_result)
-df['vector'] = df.apply(lambda row: get_embedding(f"{row['question']} {row['answer']}"), axis=1)
-
-client = MilvusClient(
-    uri = os.environ.get('MILVUS_URI')
-)
-client.use_database('digicamp_ai_miniproject')
-
-res = client.insert(
-    collection_name = 'Allen_IU_MiniProject',
-    data=df.to_dict(orient='records')
-)
\ No newline at end of file
+def parse_qna(text):
+    chunk_text = split_by_numbered_items(text, keep_separators=False)
+    return [
+        {
+            "question": chunk.split('?', 1)[0].strip() + '?',
+            "answer": chunk.split('?', 1)[1].strip() if '?' in chunk else ''
+        }
+        for chunk in chunk_text if '?' in chunk
+    ]
+
+def load_faq_records(path=FAQ_PATH):
+    loader = PyMuPDFLoader(path)
+    docs = loader.load()
+    return parse_qna(''.join([doc.page_content for doc in docs]))
+
+def embed_batch(texts):
+    for attempt in range(MAX_RETRIES):
+        try:
+            # the shared client, created on first use; errors the transport gave up on are retried here
+            return get_embeddings_model().embed_documents(texts)
+        except (openai.RateLimitError, openai.APIConnectionError, openai.APITimeoutError, openai.InternalServerError) as e:
+            if attempt == MAX_RETRIES - 1:
+                raise
+            time.sleep(retry_delay(getattr(e, 'response', None), attempt, base=1.0, cap=60.0))
+
+def embed_in_batches(texts, batch_size=EMBED_BATCH_SIZE, max_workers=EMBED_WORKERS):
+    """
+        Embeds texts with embed_documents in batches of batch_size, running up to max_workers
+        batches concurrently. The result keeps the order of texts.
+    """
+    batches = [texts[i:i + batch_size] for i in range(0, len(texts), batch_size)]
+    vectors = [None] * len(batches)
+    done = 0
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(embed_batch, batch): i for i, batch in enumerate(batches)}
+        for future in as_completed(futures):
+            vectors[futures[future]] = future.result()
+            done += len(batches[futures[future]])
+            print(f"Embedded {done}/{len(texts)}")
+    return [vector for batch in vectors for vector in batch]
+
+def insert_in_chunks(client, collection_name, rows, chunk_size=INSERT_CHUNK_SIZE):
+    inserted = 0
+    for i in range(0, len(rows), chunk_size):
+        client.insert(collection_name=collection_name, data=rows[i:i + chunk_size])
+        inserted += len(rows[i:i + chunk_size])
+        print(f"Inserted {inserted}/{len(rows)}")
+    return inserted
+
+# Incremental ingestion: the manifest maps a question id to the hash of its question/answer pair
+def question_id(question):
+    return hashlib.sha256(question.strip().encode('utf-8')).hexdigest()[:32]
+
+def content_hash(record):
+    return hashlib.sha256(f"{record['question']}\0{record['answer']}".encode('utf-8')).hexdigest()
+
+def load_manifest(path=FAQ_MANIFEST_PATH):
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+def save_manifest(manifest, path=FAQ_MANIFEST_PATH):
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(f"{path}.tmp", 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(f"{path}.tmp", path)
+
+def diff_records(records, manifest, source=FAQ_PATH):
+    """
+        Compares the records parsed from one source document with that document's manifest entries.
+
+        Return:
+        (records to embed and write, manifest entries to delete, new manifest)
+    """
+    current = {}
+    for record in records:
+        # a repeated question keeps its last answer
+        current[question_id(record['question'])] = record
+
+    previous = {qid: entry for qid, entry in manifest.items() if entry.get('source', FAQ_PATH) == source}
+    upserts = [record for qid, record in current.items() if previous.get(qid, {}).get('hash') != content_hash(record)]
+    # changed pairs are deleted before their new version is inserted
+    deletes = [entry for qid, entry in previous.items() if qid not in current or entry['hash'] != content_hash(current[qid])]
+
+    new_manifest = {qid: entry for qid, entry in manifest.items() if qid not in previous}
+    new_manifest.update({qid: {"question": record['question'], "hash": content_hash(record), "source": source} for qid, record in current.items()})
+    return upserts, deletes, new_manifest
+
+def delete_questions(client, collection_name, questions, chunk_size=DELETE_CHUNK_SIZE):
+    for i in range(0, len(questions), chunk_size):
+        # json.dumps gives double-quoted, escaped string literals that Milvus filters accept
+        values = ", ".join(json.dumps(question, ensure_ascii=False) for question in questions[i:i + chunk_size])
+        client.delete(collection_name=collection_name, filter=f"question in [{values}]")
+    print(f"Deleted {len(questions)} outdated questions")
+
+def stale_questions(upserts, deletes):
+    """
+        Questions to remove before the upserts are written. Every upserted question is included,
+        not only those the manifest knows, so rerunning after a crash or without a manifest
+        replaces rows instead of duplicating them.
+    """
+    return list(dict.fromkeys([entry['question'] for entry in deletes] + [record['question'] for record in upserts]))
+
+def update_local_index(upserts, vectors, deletes):
+    stale = set(stale_questions(upserts, deletes))
+    try:
+        existing = LocalBackend.load()
+        kept = [(record, vector) for record, vector in zip(existing.records, existing.vectors) if record['question'] not in stale]
+    except FileNotFoundError:
+        kept = []
+    rows = kept + [({"question": record['question'], "answer": record['answer']}, vector) for record, vector in zip(upserts, vectors)]
+    LocalBackend.save([record for record, _ in rows], [list(vector) for _, vector in rows])
+
+def sync_faq(records, source=FAQ_PATH, full=False, batch_size=EMBED_BATCH_SIZE, workers=EMBED_WORKERS, insert_chunk_size=INSERT_CHUNK_SIZE):
+    """ Brings the FAQ vector store in line with the records of one source document. Returns the number of written pairs. """
+    manifest = load_manifest()
+    if full:
+        # forget the hashes of this source only: all of its pairs are re-embedded and its old rows
+        # deleted, while the rows and manifest entries of other sources stay as they are
+        manifest = {qid: {**entry, "hash": None} if entry.get('source', FAQ_PATH) == source else entry for qid, entry in manifest.items()}
+    upserts, deletes, new_manifest = diff_records(records, manifest, source)
+    print(f"{source}: {len(upserts)} new or changed pairs, {len(deletes)} pairs to delete")
+    if not upserts and not deletes:
+        return 0
+
+    df = pd.DataFrame.from_records(upserts, columns=['question', 'answer'])
+    df['vector'] = embed_in_batches((df['question'] + ' ' + df['answer']).tolist(), batch_size, workers) if len(df) else []
+
+    if FAQ_BACKEND == 'local':
+        # single-node deployments search this file in-process instead of Milvus
+        update_local_index(upserts, df['vector'].tolist(), deletes)
+    else:
+        client = get_client()
+        delete_questions(client, MILVUS_COLLECTION, stale_questions(upserts, deletes))
+        insert_in_chunks(client, MILVUS_COLLECTION, df.to_dict(orient='records'), insert_chunk_size)
+
+    save_manifest(new_manifest)
+    # cached answers were built from the previous collection
+    bump_version()
+    return len(upserts)
+
+def main():
+    parser = argparse.ArgumentParser(description="Embed the FAQ document and load it into the FAQ vector store.")
+    parser.add_argument('--path', default=FAQ_PATH)
+    parser.add_argument('--batch-size', type=int, default=EMBED_BATCH_SIZE)
+    parser.add_argument('--workers', type=int, default=EMBED_WORKERS)
+    parser.add_argument('--insert-chunk-size', type=int, default=INSERT_CHUNK_SIZE)
+    parser.add_argument('--full', action='store_true', help="Ignore the manifest hashes of --path, delete its rows and re-embed all of its pairs.")
+    args = parser.parse_args()
+
+    sync_faq(load_faq_records(args.path), source=args.path, full=args.full, batch_size=args.batch_size,
+             workers=args.workers, insert_chunk_size=args.insert_chunk_size)
+
+if __name__ == "__main__":
+    main()
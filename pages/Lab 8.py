@@ -1,14 +1,14 @@
 import streamlit as st
 import os
 from langchain_core.messages import AIMessageChunk, HumanMessage, AIMessage, SystemMessage
-import agents.graph as gr
-import agents.DOCSQNA as DOCSQNA
-import agents.DBQNA as DBQNA
-import agents.RAG as RAG
-from langchain_community.document_loaders import PyPDFLoader
-from langchain_text_splitters import RecursiveCharacterTextSplitter
+from agents.registry import get_graph
+from agents.telemetry import start_exporters
+from agents.router import get_router
+from agents.fanout import FANOUT_MIN_SCORE, run_first_acceptable
+from langgraph.constants import TAG_NOSTREAM
 from langgraph.graph import MessagesState, StateGraph, START, END
 from langgraph.types import Command
+from langchain_core.runnables import RunnableConfig
 from typing import Literal
 from pydantic import BaseModel, Field
 from langgraph.checkpoint.memory import InMemorySaver
@@ -18,17 +18,25 @@ st.title("Simple Graph with Streamlit")
 from dotenv import load_dotenv
 load_dotenv(override=True)
 
+# metrics endpoint / file, when configured through TELEMETRY_PORT / TELEMETRY_METRICS_PATH
+start_exporters()
+
 def get_stream():
-    for chunk, metadata in gr.agent.stream({"messages":"what is 4 + 7"}, stream_mode="messages"):
+    for chunk, metadata in get_graph("simple").stream({"messages":"what is 4 + 7"}, stream_mode="messages"):
         if isinstance(chunk, AIMessageChunk):
             yield chunk
 
 st.write_stream(get_stream)
 
-DB_PATH = os.environ['DB_PATH']
+DB_PATH = os.environ.get('DB_PATH')
+# ask RAG and DOCSQNA (FANOUT_AGENTS) at once when the router is unsure, instead of asking the LLM
+SUPERVISOR_FANOUT = os.environ.get('SUPERVISOR_FANOUT', '0') == '1'
+
+from agents.llm import get_chat_model
 
-from langchain.chat_models import init_chat_model
-model = init_chat_model("gpt-4.1-mini", model_provider= "openai")
+@st.cache_resource
+def get_model():
+    return get_chat_model("gpt-4.1-mini")
 
 class BestAgent(BaseModel):
     agent_name: str = Field(description = "The best agent to handle specific request from users.")
@@ -36,40 +44,61 @@ class BestAgent(BaseModel):
 class SupervisorState(MessagesState):
     user_question : str 
 
-def supervisor(state: SupervisorState) -> Command[Literal["DBQNA", "RAG", "DOCSQNA", END]]:
-    last_message = state["messages"][-1]
+def llm_route(last_message):
     instruction = [SystemMessage(content=f"""You receive the following question from users. Decide which agent is the most suitable for completing the task.
                                     Delegate to DBQNA agent if users ask a question that can be answered by data inside a database. 
                                     Delegate to RAG agent if users ask a question about Dexa Medica company profile.
                                     Delegate to DOCSQNA agent if users ask a question about Dexa Medica other than company profile.
                                     End the conversation after you receive answer from agents.
                                  """)]
-    model_with_structure = model.with_structured_output(BestAgent)
+    model_with_structure = get_model().with_structured_output(BestAgent)
     response = model_with_structure.invoke(instruction + [last_message])
+    return response.agent_name
+
+def supervisor(state: SupervisorState) -> Command[Literal["DBQNA", "RAG", "DOCSQNA", "FANOUT", END]]:
+    last_message = state["messages"][-1]
+    # keyword rules and embedding centroids first, the LLM (or the fan-out) only when they are unsure
+    fallback = None if SUPERVISOR_FANOUT else lambda question: llm_route(last_message)
+    agent, _, _ = get_router().route(last_message.content, fallback=fallback)
     return Command(
         update= {'user_question': last_message.content},
-        goto=response.agent_name
+        goto=agent or "FANOUT"
+    )
+
+def callFanOut(state: SupervisorState) -> Command[Literal["DBQNA", "RAG", "DOCSQNA", END]]:
+    prompt = state['user_question']
+    # concurrent answers would interleave in the UI, so only the winning answer is shown
+    # runs on the process-wide fan-out loop, a new loop per question would strand the pooled connections
+    agent, answer, score = run_first_acceptable(prompt, config={"tags": [TAG_NOSTREAM]})
+    if agent is None or score < FANOUT_MIN_SCORE:
+        # no agent had a usable answer, let the LLM choose one
+        return Command(goto=llm_route(state["messages"][-1]))
+    return Command(
+        goto=END,
+        update={"messages": {"role": "assistant", "content": answer}}
     )
 
-def callRAG(state: SupervisorState) -> Command[Literal['supervisor']]:
+# the node config is passed on, so the sub-agent's tokens reach the supervisor stream as they are generated
+def callRAG(state: SupervisorState, config: RunnableConfig) -> Command[Literal['supervisor']]:
     prompt = state['user_question']
-    response = RAG.graph.invoke({"messages":HumanMessage(content=prompt)})
+    response = get_graph("RAG").invoke({"messages":HumanMessage(content=prompt)}, config)
     return Command(
         goto=END,
         update={"messages": response['messages'][-1]}
     )
 
-def callDBQNA(state: SupervisorState) -> Command[Literal['supervisor']]:
+def callDBQNA(state: SupervisorState, config: RunnableConfig) -> Command[Literal['supervisor']]:
     prompt = state['user_question']
-    response = DBQNA.graph.invoke({"messages":HumanMessage(content=prompt), "db_name": DB_PATH, "user_question" : prompt})
+    response = get_graph("DBQNA").invoke({"messages":HumanMessage(content=prompt), "db_name": DB_PATH, "user_question" : prompt}, config)
     return Command(
         goto=END,
         update={"messages": response['messages'][-1]}
     )
 
-def callDOCSQNA(state: SupervisorState) -> Command[Literal['supervisor']]:
+def callDOCSQNA(state: SupervisorState, config: RunnableConfig) -> Command[Literal['supervisor']]:
     prompt = state['user_question']
-    response = DOCSQNA.graph.invoke({"messages": [HumanMessage(content=prompt)]})
+    # QnaState keeps the chat as {role, content} dicts
+    response = get_graph("DOCSQNA").invoke({"messages": [{"role": "user", "content": prompt}]}, config)
     answer = response.get('answer', '')
     return Command(
         goto=END,
@@ -77,15 +106,28 @@ def callDOCSQNA(state: SupervisorState) -> Command[Literal['supervisor']]:
     )
 
 # memory = InMemorySaver()
-supervisor_agent = (
-    StateGraph(SupervisorState)
-    .add_node(supervisor)
-    .add_node("RAG", callRAG)
-    .add_node("DBQNA", callDBQNA)
-    .add_node("DOCSQNA", callDOCSQNA)
-    .add_edge(START, "supervisor")
-    .compile(name= "supervisor")
-)
+# sub-agents are only built when the supervisor routes to them
+@st.cache_resource
+def build_supervisor():
+    return (
+        StateGraph(SupervisorState)
+        .add_node(supervisor)
+        .add_node("RAG", callRAG)
+        .add_node("DBQNA", callDBQNA)
+        .add_node("DOCSQNA", callDOCSQNA)
+        .add_node("FANOUT", callFanOut)
+        .add_edge(START, "supervisor")
+        .compile(name= "supervisor")
+    )
+
+supervisor_agent = build_supervisor()
+
+# sub-agent nodes whose tokens are the answer shown to the user
+ANSWER_NODES = ("respond", "final_answer", "generate")
+AGENT_NODES = ("RAG", "DBQNA", "DOCSQNA", "FANOUT")
+
+def message_content(message):
+    return message["content"] if isinstance(message, dict) else message.content
 
 prompt = st.chat_input("Write your question here ... ")
 if prompt:
@@ -98,22 +140,28 @@ if prompt:
         answer_placeholder = st.empty()
         status_placeholder.status(label="Process Start")
         state = "Process Start"
-        for chunk, metadata in supervisor_agent.stream({"messages":HumanMessage(content=prompt)}, stream_mode="messages"):
-            if metadata['langgraph_node'] != state:
-                status_placeholder.status(label=metadata['langgraph_node'])
-                state = metadata['langgraph_node']
-                final_answer = "" 
-            if metadata['langgraph_node'] == "respond":
+        # subgraphs=True yields (namespace, mode, data); namespace is empty for the supervisor's own nodes
+        for namespace, mode, data in supervisor_agent.stream({"messages":HumanMessage(content=prompt)}, stream_mode=["messages", "updates"], subgraphs=True):
+            if mode == "updates":
+                # answers that were not streamed, e.g. a DOCSQNA semantic cache hit
+                for node, update in data.items():
+                    if not namespace and node in AGENT_NODES and not final_answer and update and update.get("messages"):
+                        final_answer = message_content(update["messages"])
+                        answer_placeholder.markdown(final_answer)
+                continue
+
+            chunk, metadata = data
+            node = metadata['langgraph_node']
+            label = f"{namespace[0].split(':')[0]} › {node}" if namespace else node
+            if label != state:
+                status_placeholder.status(label=label)
+                state = label
+                if node in ANSWER_NODES:
+                    final_answer = ""
+            if namespace and node in ANSWER_NODES:
                 final_answer += chunk.content
                 answer_placeholder.markdown(final_answer)
-            if metadata['langgraph_node'] == "final_answer":
-                final_answer += chunk.content
-                answer_placeholder.markdown(final_answer)
-            
-            if metadata['langgraph_node'] == "generate":
-                final_answer += chunk.content
-                answer_placeholder.markdown(final_answer)
-        
+
         status_placeholder.status(label="Complete", state='complete')
 
             
\ No newline at end of file